@@ -0,0 +1,133 @@
+import numpy as np
+from instrumentation import stage
+
+'''
+Optical absorption spectrum of the Huckel model - transitions from occupied to virtual (unoccupied) states
+Transition dipole (zero differential overlap) mu_ov = sum_i c_io * c_iv * r_i, oscillator strength of the singlet excitation
+f = 4/3 * dE * |mu|**2 in atomic units, spectrum = sum of f broadened by a Gaussian or a Lorentzian
+Dipoles of a whole block of occupied states with all virtual states are one matrix product (C_o * r)^T C_v
+'''
+
+hartree = 27.211386
+bohr = 0.529177
+
+
+def transition_dtype():
+    '''
+    :return: dtype of one row of the table of transitions
+    '''
+    return np.dtype([("occupied", "i8"), ("virtual", "i8"), ("energy", "f8"), ("strength", "f8"),
+                     ("dipole", "f8", (3,))])
+
+def oscillator_strength(energy, dipole_squared):
+    '''
+    :param energy: excitation energy [eV]
+    :param dipole_squared: |mu|**2 of the orbital transition [(e * Angstrom)**2]
+    :return: oscillator strength of the singlet excitation (factor 2 for the spin)
+    '''
+    return 4 / 3 * (energy / hartree) * (dipole_squared / bohr**2)
+
+def block_size(dimension, virtual_count, memory_limit):
+    '''
+    :return: number of occupied states processed together so that the arrays of one block fit into memory_limit [B]
+    '''
+    per_state = 8 * (dimension * 4 + virtual_count * 8)
+    return int(max(1, min(memory_limit // per_state, 1 << 20)))
+
+def broadening_kernel(offsets, width, shape):
+    '''
+    :return: line shape with unit area at the energy offsets - "gaussian" (width = sigma) or "lorentzian" (width = half width)
+    '''
+    if shape == "gaussian":
+        return np.exp(-0.5 * (offsets / width)**2) / (width * np.sqrt(2 * np.pi))
+    if shape == "lorentzian":
+        return width / np.pi / (offsets**2 + width**2)
+    raise ValueError("Parameter 'shape' must be 'gaussian' or 'lorentzian'")
+
+def merge_top(top, candidates, count):
+    '''
+    :return: 'count' strongest transitions of both tables, sorted by decreasing strength
+    '''
+    merged = np.concatenate((top, candidates))
+    if len(merged) > count:
+        merged = merged[np.argpartition(-merged["strength"], count - 1)[:count]]
+    return merged[np.argsort(-merged["strength"], kind="stable")]
+
+@stage
+def absorption_spectrum(eigenvalues, eigenvectors, coordinates, occupied_count, energies = None, broadening = 0.1,
+                        shape = "gaussian", energy_window = None, top = 10, memory_limit = 256 * 2**20):
+    '''
+    :param eigenvalues, eigenvectors: states sorted by energy (Huckel_model)
+    :param coordinates: (N,2) or (N,3) coordinates of the atoms [Angstrom]
+    :param occupied_count: number of occupied states (the lowest states)
+    :param energies: uniform energy grid of the spectrum [eV], None -> 2001 points from 0 to the highest excitation energy
+    :param broadening: sigma of the Gaussian / half width of the Lorentzian [eV]
+    :param energy_window: tuple (lowest, highest) excitation energy - pairs outside are not computed (None -> all pairs)
+    :param top: number of returned strongest transitions
+    :param memory_limit: memory of the arrays of one block of occupied states [B]
+    :return: tuple (energies, spectrum - oscillator strength per eV, table of the 'top' strongest transitions
+             (structured array, see 'transition_dtype') sorted by decreasing strength)
+    '''
+    if not broadening > 0:
+        raise ValueError("Parameter 'broadening' must be positive")
+    eigenvalues = np.asarray(eigenvalues, dtype=float)
+    coordinates = np.asarray(coordinates, dtype=float)
+    positions = np.zeros((len(coordinates), 3))
+    positions[:, :coordinates.shape[1]] = coordinates
+    occupied = np.arange(occupied_count)
+    lowest, highest = (0.0, np.inf) if energy_window is None else energy_window
+    virtual_energies = eigenvalues[occupied_count:]
+    '''
+    Views (basic slicing) - fancy indexing would copy N x V per block and axis
+    '''
+    virtual_vectors = eigenvectors[:, occupied_count:]
+    if energies is None:
+        maximum = min(highest, virtual_energies[-1] - eigenvalues[0]) if len(virtual_energies) and occupied_count else 1.0
+        energies = np.linspace(0, maximum + 5 * broadening, 2001)
+    energies = np.asarray(energies, dtype=float)
+    step = energies[1] - energies[0] if len(energies) > 1 else 1.0
+    if len(energies) > 1 and not np.allclose(np.diff(energies), step):
+        raise ValueError("Parameter 'energies' must be a uniform grid")
+    sticks = np.zeros(len(energies))
+    transitions = np.zeros(0, dtype=transition_dtype())
+    size = block_size(len(positions), len(virtual_energies), memory_limit)
+    for start in range(0, occupied_count, size):
+        block = occupied[start:start + size]
+        '''
+        Virtual states reachable from the block within the energy window (eigenvalues are sorted)
+        '''
+        first = np.searchsorted(virtual_energies, eigenvalues[block[0]] + lowest, side="left")
+        last = np.searchsorted(virtual_energies, eigenvalues[block[-1]] + highest, side="right")
+        if last <= first:
+            continue
+        virtual = occupied_count + np.arange(first, last)
+        excitation = eigenvalues[virtual][None, :] - eigenvalues[block][:, None]
+        weighted = eigenvectors[:, start:start + len(block)]
+        reachable = virtual_vectors[:, first:last]
+        dipoles = np.stack([(weighted * positions[:, axis, None]).T @ reachable for axis in range(3)], axis=-1)
+        strength = oscillator_strength(excitation, np.sum(dipoles**2, axis=-1))
+        inside = (excitation >= lowest) & (excitation <= highest)
+        '''
+        Stick spectrum distributed linearly between the two nearest grid points (first moment preserved)
+        '''
+        position = (excitation[inside] - energies[0]) / step
+        index = np.floor(position).astype(np.int64)
+        fraction = position - index
+        kept = (index >= -1) & (index < len(energies))
+        for shift, weight in ((0, 1 - fraction), (1, fraction)):
+            target = index[kept] + shift
+            valid = (target >= 0) & (target < len(energies))
+            sticks += np.bincount(target[valid], (strength[inside] * weight)[kept][valid], minlength=len(sticks))
+        if top > 0 and np.any(inside):
+            rows, columns = np.nonzero(inside)
+            candidates = np.zeros(len(rows), dtype=transition_dtype())
+            candidates["occupied"], candidates["virtual"] = block[rows], virtual[columns]
+            candidates["energy"], candidates["strength"] = excitation[rows, columns], strength[rows, columns]
+            candidates["dipole"] = dipoles[rows, columns]
+            if len(candidates) > top:
+                candidates = candidates[np.argpartition(-candidates["strength"], top - 1)[:top]]
+            transitions = merge_top(transitions, candidates, top)
+    count = len(energies)
+    kernel = broadening_kernel(np.arange(-count, count + 1) * step, broadening, shape)
+    spectrum = np.convolve(sticks, kernel)[count:2 * count]
+    return energies, spectrum, transitions
@@ -0,0 +1,88 @@
+import numpy as np
+import scipy as scp
+from instrumentation import stage
+
+'''
+Eigenvalue problem of Huckel Hamiltonians with structure - disconnected fragments of the molecule are independent blocks
+and long ribbons have a narrow band after the reverse Cuthill-McKee reordering of the atoms
+Results are always returned in the original atom order, eigenvalues sorted over all fragments
+'''
+
+
+def fragments(hamiltonian):
+    '''
+    :param hamiltonian: sparse symmetric Hamiltonian
+    :return: list of arrays - atom indices of every connected fragment (increasing order)
+    '''
+    count, labels = scp.sparse.csgraph.connected_components(hamiltonian, directed=False)
+    order = np.argsort(labels, kind="stable")
+    return np.split(order, np.cumsum(np.bincount(labels, minlength=count))[:-1])
+
+def bandwidth(hamiltonian):
+    '''
+    :return: largest |i - j| of the non-zero elements of the sparse matrix
+    '''
+    coo = hamiltonian.tocoo()
+    return int(np.max(np.abs(coo.row - coo.col))) if coo.nnz else 0
+
+def reverse_cuthill_mckee(hamiltonian):
+    '''
+    :return: tuple (permutation of the atoms, permuted csr matrix) - the permutation minimises the bandwidth
+    '''
+    permutation = scp.sparse.csgraph.reverse_cuthill_mckee(scp.sparse.csr_matrix(hamiltonian), symmetric_mode=True)
+    return permutation, scp.sparse.csr_matrix(hamiltonian)[permutation][:, permutation]
+
+def banded_storage(hamiltonian, width):
+    '''
+    :return: upper banded storage (width + 1, N) of the symmetric matrix for 'scipy.linalg.eig_banded'
+    '''
+    coo = scp.sparse.triu(hamiltonian).tocoo()
+    band = np.zeros((width + 1, hamiltonian.shape[0]))
+    band[width + coo.row - coo.col, coo.col] = coo.data
+    return band
+
+def fragment_eigh(hamiltonian, eigenvalues_only = False, banded_ratio = 0.1):
+    '''
+    Solves one connected fragment
+    eigenvalues only - banded solver after the reverse Cuthill-McKee reordering (O(N * b**2)) if the bandwidth b is
+                       below banded_ratio * N, dense otherwise
+    eigenvectors - dense solver (the eigenvector matrix itself has N**2 elements, the banded solver is not faster)
+    :return: tuple (eigenvalues, eigenvectors or None)
+    '''
+    dimension = hamiltonian.shape[0]
+    if eigenvalues_only:
+        if dimension > 2:
+            permutation, permuted = reverse_cuthill_mckee(hamiltonian)
+            width = bandwidth(permuted)
+            if width < banded_ratio * dimension:
+                return scp.linalg.eig_banded(banded_storage(permuted, width), eigvals_only=True), None
+        return scp.linalg.eigh(hamiltonian.toarray(), eigvals_only=True), None
+    return scp.linalg.eigh(hamiltonian.toarray())
+
+@stage
+def structured_eigh(hamiltonian, eigenvalues_only = False, banded_ratio = 0.1):
+    '''
+    Whole spectrum of the sparse symmetric Hamiltonian - every connected fragment is diagonalised separately
+    :param eigenvalues_only: 'True' -> eigenvectors are not computed (banded solver for narrow-band fragments)
+    :param banded_ratio: the banded solver is used if bandwidth < banded_ratio * size of the fragment
+    :return: tuple (eigenvalues sorted by energy, (N, N) eigenvectors in the original atom order or None)
+    '''
+    hamiltonian = scp.sparse.csr_matrix(hamiltonian)
+    dimension = hamiltonian.shape[0]
+    parts = fragments(hamiltonian) if dimension else []
+    if len(parts) == 1 and not eigenvalues_only:
+        return scp.linalg.eigh(hamiltonian.toarray())
+    eigenvalues = np.zeros(dimension)
+    eigenvectors = None if eigenvalues_only else np.zeros((dimension, dimension))
+    start = 0
+    for atoms in parts:
+        values, vectors = fragment_eigh(hamiltonian[atoms][:, atoms], eigenvalues_only, banded_ratio)
+        columns = slice(start, start + len(atoms))
+        eigenvalues[columns] = values
+        if vectors is not None:
+            eigenvectors[atoms, columns] = vectors
+        start += len(atoms)
+    order = np.argsort(eigenvalues, kind="stable")
+    if eigenvectors is None:
+        return eigenvalues[order], None
+    return eigenvalues[order], eigenvectors[:, order]
@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import utils
+import rendering
+from molecule_constructor import Molecule_constructor
+from huckel_model import Huckel_model
+from bond_length_analyzer import Bond_lenght_Analyzer
+
+'''
+Benchmarks of the individual stages (parsing, distance matrix, neighbour list, Hamiltonian + diagonalisation,
+bond orders, rendering) on synthetic molecules of growing size
+Usage: python benchmark.py --sizes 100 1000 5000 --output results.json --baseline baseline.json
+'''
+
+default_sizes = (100, 300, 1000, 3000, 10000, 20000)
+
+
+def synthetic_molecule(atoms, directory):
+    '''
+    Creates an approximately square molecule with about 'atoms' carbon atoms (width and length grow together)
+    :return: name of the created ".xyz" file
+    '''
+    rings = 2 * int(np.sqrt(atoms / 8)) + 1
+    repetitions = max(1, int(round(atoms / (4 * rings))))
+    file_name = os.path.join(directory, f"molecule_{atoms}")
+    Molecule_constructor(1.4, 1.4, rings, repetitions, file_name).molecule_coordinates_to_xyz_file()
+    return f"{file_name}.xyz"
+
+def measure(function, repeat = 5, warmup = 1):
+    '''
+    Runs the function 'warmup' times without measuring (imports, matplotlib setup, caches of numpy and scipy),
+    'repeat' times with tracemalloc switched off (wall time) and once more traced (peak memory) - the tracing
+    overhead is not part of the times
+    :return: tuple (result of the last run, median wall time [s], best wall time [s], peak of the memory allocated
+             during one run [B])
+    '''
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, float(np.median(times)), float(np.min(times)), peak
+
+def stages(file, dense_limit):
+    '''
+    Generator of the benchmarked stages for one molecule - tuples (name, function)
+    Stages working with dense N x N matrices are skipped for molecules larger than 'dense_limit'
+    '''
+    coordinates = utils.load_coordinates(file, carbon_only=True)
+    dense = len(coordinates) <= dense_limit
+    '''
+    Every stage gets the model it needs here (setup is not measured) - no stage depends on the state left by another
+    '''
+    model = Huckel_model(coordinates, number_of_states=2, solver="none")
+    model.file_name = file
+    yield "load_coordinates", lambda: utils.load_coordinates(file, carbon_only=True)
+    yield "neighbour_list", lambda: utils.neighbour_list(coordinates, Huckel_model.skeleton_distance)
+    yield "sparse_hamiltonian", lambda: model.create_hamiltonian(0, -2.8, False, 1.10, 1.60, solver="sparse")
+    if dense:
+        yield "distance_matrix", lambda: utils.distance_matrix(coordinates)
+        yield "create_hamiltonian", lambda: model.create_hamiltonian(0, -2.8, False, 1.10, 1.60, solver="dense")
+        yield "banded_eigenvalues", lambda: model.create_hamiltonian(0, -2.8, False, 1.10, 1.60, solver="banded")
+        dense_model = Huckel_model(coordinates, solver="dense")
+        dense_model.file_name = file
+        def bond_charge():
+            dense_model._bond_charge_matrix = None
+            return dense_model.bond_charge()
+        yield "bond_charge", bond_charge
+        yield "graph_bond_charge", lambda: dense_model.graph_bond_charge(labels=False)
+    analyzer = Bond_lenght_Analyzer(file)
+    yield "graph_2d", lambda: analyzer.graph_2d(labels=False)
+
+def run(sizes, dense_limit = 5000, repeat = 5, warmup = 1):
+    '''
+    Benchmarks all stages for all sizes (figures are rendered headless into a temporary directory)
+    :return: list of records {"stage", "size", "atoms", "time" (median), "best_time", "peak_memory"}
+    '''
+    rendering.set_headless()
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            file = synthetic_molecule(size, directory)
+            atoms = len(utils.load_coordinates(file, carbon_only=True))
+            for stage, function in stages(file, dense_limit):
+                _, wall_time, best_time, peak = measure(function, repeat, warmup)
+                records.append({"stage": stage, "size": size, "atoms": atoms, "time": wall_time, "best_time": best_time,
+                                "peak_memory": peak})
+                print(f"{stage:20s} {atoms:7d} atoms {wall_time:10.4f} s {peak / 2**20:10.1f} MiB", flush=True)
+    return records
+
+def scaling_exponents(records):
+    '''
+    Empirical scaling exponent of every stage - slope of log(time) against log(atoms) (least squares)
+    :return: dictionary {stage: exponent} (stages measured for at least two sizes)
+    '''
+    exponents = {}
+    for stage in dict.fromkeys(record["stage"] for record in records):
+        atoms = np.array([record["atoms"] for record in records if record["stage"] == stage], dtype=float)
+        times = np.array([record["time"] for record in records if record["stage"] == stage])
+        if len(np.unique(atoms)) >= 2:
+            exponents[stage] = float(np.polyfit(np.log(atoms), np.log(times), 1)[0])
+    return exponents
+
+def compare(records, baseline, threshold = 0.5, time_resolution = 0.005):
+    '''
+    Compares the results with a baseline (results of an older run) - stage and size must match, times are the medians
+    of the repeated runs
+    :param threshold: relative slowdown (time or memory) reported as a regression - above the run-to-run noise
+                      (up to ~30 % for stages of a few milliseconds)
+    :param time_resolution: slowdowns smaller than this [s] are never reported (timer and scheduler noise)
+    :return: list of regressions {"stage", "size", "quantity", "baseline", "current", "ratio"}
+    '''
+    reference = {(record["stage"], record["size"]): record for record in baseline["results"]}
+    regressions = []
+    for record in records:
+        old = reference.get((record["stage"], record["size"]))
+        if old is None:
+            continue
+        for quantity in ("time", "peak_memory"):
+            if quantity == "time" and record[quantity] - old[quantity] < time_resolution:
+                continue
+            if old[quantity] > 0 and record[quantity] > (1 + threshold) * old[quantity]:
+                regressions.append({"stage": record["stage"], "size": record["size"], "quantity": quantity,
+                                    "baseline": old[quantity], "current": record[quantity], "ratio": record[quantity] / old[quantity]})
+    return regressions
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the Molecular-Insight_Toolkit stages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=default_sizes, help="approximate numbers of atoms")
+    parser.add_argument("--dense-limit", type=int, default=5000, help="largest molecule for the dense (N x N) stages")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs of every stage (median is kept)")
+    parser.add_argument("--warmup", type=int, default=1, help="number of unmeasured runs of every stage before the measurement")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file with the results")
+    parser.add_argument("--baseline", help="JSON file of an older run - regressions are reported")
+    parser.add_argument("--threshold", type=float, default=0.5, help="relative slowdown reported as a regression")
+    arguments = parser.parse_args(arguments)
+    records = run(arguments.sizes, arguments.dense_limit, arguments.repeat, arguments.warmup)
+    exponents = scaling_exponents(records)
+    report = {"machine": {"python": sys.version.split()[0], "numpy": np.__version__, "platform": platform.platform(),
+                          "cpus": os.cpu_count()},
+              "results": records, "scaling_exponents": exponents}
+    print("\nScaling exponents (time ~ atoms^k):")
+    for stage, exponent in exponents.items():
+        print(f"{stage:20s} {exponent:6.2f}")
+    regressions = []
+    if arguments.baseline:
+        with open(arguments.baseline, "r") as f:
+            regressions = compare(records, json.load(f), arguments.threshold)
+        report["regressions"] = regressions
+        print(f"\n{len(regressions)} regression(s) against {arguments.baseline}")
+        for regression in regressions:
+            print(f"{regression['stage']:20s} {regression['size']:7d} {regression['quantity']:12s} x{regression['ratio']:.2f}")
+    with open(arguments.output, "w") as f:
+        json.dump(report, f, indent=1)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,56 +1,213 @@
 import utils
-import matplotlib.pyplot as plt
-from matplotlib import cm
+from molecule import Molecule
+from instrumentation import stage
+import rendering
 import numpy as np
 
 class Bond_lenght_Analyzer:
     '''
     Class for analyzing bond lengths in a molecule based on relaxed coordinates
     '''
+    @stage(arrays=lambda self, *args, **kwargs: {"molecule_coordinates": self.molecule_coordinates, "bonds": self.bonds[2]})
     def __init__(self, file_xyz, dimension = 2, minimal_distance = 1.35, maximal_distance = 2):
         '''
         :param file_xyz: File containing molecule coordinates. Accepted formats: ".xyz" or ".in".
+                         A Molecule (molecule.py - graphs are saved under its name), an (N,2) or (N,3) array of coordinates
+                         (carbon atoms) or a tuple (element codes, coordinates) as returned by 'utils.read_geometry'
+                         is also accepted (graphs are saved as "molecule...").
         :param minimal_distance: Minimum bond length between adjacent atoms.
                                  For carbon-carbon bonds, the minimum value is ~1.15 Angstrom.
                                  Different rules apply for bonds between other atoms (e.g., carbon-hydrogen ~1 Angstrom).
         :param maximal_distance: Maximum bond length between adjacent atoms.
                                  For carbon-carbon bonds, the maximum value is ~1.55 Angstrom.
         '''
-        self.file = file_xyz
-        if dimension == 2:
-            self.molecule_coordinates = utils.load_coordinates(file=file_xyz, carbon_only=False)
-            self.distance_matrix = utils.distance_matrix(self.molecule_coordinates)
-        elif dimension == 3:
-            self.molecule_coordinates = utils.load_coordinates_3d(file=file_xyz, carbon_only=False)
-            self.distance_matrix = utils.distance_matrix_3d(self.molecule_coordinates)
+        if dimension not in (2, 3):
+            raise ValueError("Parameter 'dimension' must be 2 or 3")
+        if isinstance(file_xyz, Molecule):
+            self.molecule = file_xyz
+        elif isinstance(file_xyz, np.ndarray):
+            self.molecule = Molecule.carbon(file_xyz)
+        elif isinstance(file_xyz, tuple):
+            self.molecule = Molecule(*file_xyz)
+        else:
+            self.molecule = Molecule.from_file(file_xyz)
+        self.file = self.molecule.name
+        self.trajectory_file = file_xyz if isinstance(file_xyz, str) else None
+        self.dimension = dimension
+        self.elements = self.molecule.elements
+        self.molecule_coordinates = self.molecule.coordinates[:, :dimension]
         self.v_min = minimal_distance
         self.v_max = maximal_distance
+        self.bonds = self.find_bonds()
+
+    def find_bonds(self):
+        '''
+        Finds all bonds - pairs of atoms i < j with minimal_distance < distance < maximal_distance (neighbour list)
+        :return: tuple of arrays (i, j, bond length)
+        '''
+        return self.molecule.bonds(self.v_min, self.v_max, self.dimension)
+
+    def bond_elements(self):
+        '''
+        :return: tuple (element pair names "X-Y" - X is the element with the lower code, array of the pair index of every bond)
+        '''
+        i, j, _ = self.bonds
+        first = np.minimum(self.elements[i], self.elements[j]).astype(np.int64)
+        second = np.maximum(self.elements[i], self.elements[j]).astype(np.int64)
+        pair_codes, pair_index = np.unique(first * len(utils.periodic_table) + second, return_inverse=True)
+        names = [f"{utils.periodic_table[code // len(utils.periodic_table)]}-{utils.periodic_table[code % len(utils.periodic_table)]}"
+                 for code in pair_codes.tolist()]
+        return names, pair_index.reshape(-1)
+
+    def bond_alternation(self):
+        '''
+        Bond length alternation computed from the bonds sharing an atom (no path search)
+        :return: tuple (per bond - length minus the mean length of the adjacent bonds (NaN for an isolated bond),
+                        per atom - longest minus shortest bond of the atom (NaN for atoms with less than two bonds))
+        '''
+        i, j, length = self.bonds
+        atoms = len(self.molecule_coordinates)
+        degree = np.bincount(i, minlength=atoms) + np.bincount(j, minlength=atoms)
+        total = np.bincount(i, length, minlength=atoms) + np.bincount(j, length, minlength=atoms)
+        adjacent = degree[i] + degree[j] - 2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            bond = np.where(adjacent > 0, length - (total[i] + total[j] - 2 * length) / adjacent, np.nan)
+        longest = np.full(atoms, -np.inf)
+        shortest = np.full(atoms, np.inf)
+        for ends in (i, j):
+            np.maximum.at(longest, ends, length)
+            np.minimum.at(shortest, ends, length)
+        atom = np.where(degree >= 2, longest - shortest, np.nan)
+        return bond, atom
+
+    @stage
+    def bond_report(self, bins = 50):
+        '''
+        Numeric bond analysis of the molecule without any figure - all values are computed from the bond list at once
+        :param bins: number of histogram bins between minimal_distance and maximal_distance
+        :return: dictionary with bond indices 'i', 'j', 'length', 'pair' (index into 'pairs'), 'alternation' (per bond),
+                 'atom_alternation' (per atom), 'bin_edges' and 'pairs' - dictionary {"X-Y": {"count", "mean", "std",
+                 "min", "max", "histogram"}}, and the whole-molecule 'mean_alternation' (mean |alternation| of the bonds)
+                 and 'max_alternation' (max per atom alternation) - NaN if not defined
+        '''
+        i, j, length = self.bonds
+        names, pair = self.bond_elements()
+        pair_count = len(names)
+        bin_edges = np.linspace(self.v_min, self.v_max, bins + 1)
+        bin_index = np.clip(np.searchsorted(bin_edges, length, side="right") - 1, 0, bins - 1)
+        histogram = np.bincount(pair * bins + bin_index, minlength=pair_count * bins).reshape(pair_count, bins)
+        count = np.bincount(pair, minlength=pair_count)
+        mean = np.bincount(pair, length, minlength=pair_count) / np.maximum(count, 1)
+        std = np.sqrt(np.bincount(pair, (length - mean[pair])**2, minlength=pair_count) / np.maximum(count, 1))
+        minimum = np.full(pair_count, np.inf)
+        maximum = np.full(pair_count, -np.inf)
+        np.minimum.at(minimum, pair, length)
+        np.maximum.at(maximum, pair, length)
+        alternation, atom_alternation = self.bond_alternation()
+        defined_bonds = alternation[~np.isnan(alternation)]
+        defined_atoms = atom_alternation[~np.isnan(atom_alternation)]
+        return {"i": i, "j": j, "length": length, "pair": pair, "alternation": alternation,
+                "atom_alternation": atom_alternation, "bin_edges": bin_edges,
+                "pairs": {name: {"count": int(count[k]), "mean": float(mean[k]), "std": float(std[k]),
+                                 "min": float(minimum[k]), "max": float(maximum[k]), "histogram": histogram[k]}
+                          for k, name in enumerate(names)},
+                "mean_alternation": float(np.abs(defined_bonds).mean()) if len(defined_bonds) else np.nan,
+                "max_alternation": float(defined_atoms.max()) if len(defined_atoms) else np.nan}
+
+    def bond_table(self):
+        '''
+        :return: structured numpy array - one row (i, j, first, second, length, alternation) for every bond,
+                 'first' and 'second' are the element symbols of the atoms i and j
+        '''
+        i, j, length = self.bonds
+        alternation, _ = self.bond_alternation()
+        symbols = np.array(utils.periodic_table)
+        table = np.zeros(len(length), dtype=[("i", "i8"), ("j", "i8"), ("first", "U3"), ("second", "U3"),
+                                             ("length", "f8"), ("alternation", "f8")])
+        table["i"], table["j"], table["length"], table["alternation"] = i, j, length, alternation
+        table["first"], table["second"] = symbols[self.elements[i]], symbols[self.elements[j]]
+        return table
+
+    def iterate_trajectory(self, file = None):
+        '''
+        Streams a multi-frame ".xyz" file frame by frame - the bonds detected in the first frame are reused in every frame
+        :param file: trajectory file, None -> the file the analyzer was created from (required if it was created from
+                     a Molecule, an array or a tuple)
+        :return: yields array of bond lengths (same order as 'bonds') for every frame
+        '''
+        file = file or self.trajectory_file
+        if file is None:
+            raise ValueError("The analyzer was not created from a file - pass the trajectory file as parameter 'file'")
+        i, j, _ = self.bonds
+        columns = self.molecule_coordinates.shape[1]
+        for elements, coordinates in utils.read_xyz_frames(file):
+            if len(coordinates) != len(self.molecule_coordinates):
+                raise ValueError("All frames of the trajectory must contain the same atoms")
+            coordinates = coordinates[:, :columns]
+            yield np.sqrt(np.sum((coordinates[i] - coordinates[j])**2, axis=1))
+
+    @stage
+    def trajectory_statistics(self, bins = 50, file = None, per_frame = True):
+        '''
+        Computes bond length statistics over all frames of a trajectory incrementally - the per bond statistics take
+        constant memory, the per frame arrays grow by 3 floats per frame
+        :param bins: number of histogram bins between minimal_distance and maximal_distance
+        :param file: trajectory file (see 'iterate_trajectory')
+        :param per_frame: False -> 'frame_mean', 'frame_min', 'frame_max' are not collected (empty arrays), the memory
+                          stays constant for any number of frames
+        :return: dictionary with bond indices 'i', 'j', per bond 'mean', 'std', 'min', 'max' and 'histogram' (bonds x bins),
+                 'bin_edges', per frame 'frame_mean', 'frame_min', 'frame_max' and number of 'frames'
+        '''
+        bond_count = len(self.bonds[0])
+        bin_edges = np.linspace(self.v_min, self.v_max, bins + 1)
+        histogram = np.zeros((bond_count, bins), dtype=np.int64)
+        mean = np.zeros(bond_count)
+        squares = np.zeros(bond_count)
+        minimum = np.full(bond_count, np.inf)
+        maximum = np.full(bond_count, -np.inf)
+        frame_mean, frame_min, frame_max = [], [], []
+        frames = 0
+        for lengths in self.iterate_trajectory(file):
+            frames += 1
+            # Welford update of the running mean and sum of squared deviations
+            delta = lengths - mean
+            mean += delta / frames
+            squares += delta * (lengths - mean)
+            np.minimum(minimum, lengths, out=minimum)
+            np.maximum(maximum, lengths, out=maximum)
+            bin_index = np.clip(np.searchsorted(bin_edges, lengths, side="right") - 1, 0, bins - 1)
+            histogram[np.arange(bond_count), bin_index] += 1
+            if per_frame and bond_count:
+                frame_mean.append(lengths.mean())
+                frame_min.append(lengths.min())
+                frame_max.append(lengths.max())
+        return {"i": self.bonds[0], "j": self.bonds[1], "mean": mean, "std": np.sqrt(squares / max(frames, 1)),
+                "min": minimum, "max": maximum, "histogram": histogram, "bin_edges": bin_edges,
+                "frame_mean": np.array(frame_mean), "frame_min": np.array(frame_min), "frame_max": np.array(frame_max),
+                "frames": frames}
 
 
-    def graph_2d(self):
+    @stage
+    def graph_2d(self, labels = None):
         '''
         Generates a 2D graph depicting bond lengths in the molecule defined by coordinates in ".xyz" format.
         Different bond lengths are represented with different colors, and each bond is labeled with its length.
+        :param labels: 'False' -> bonds are not labeled with their length (much faster for large molecules)
+                       None -> labels only for small molecules (rendering.show_labels)
         '''
-        triangular_matrix = np.triu(self.distance_matrix, k=1)
-        indices = np.where((triangular_matrix < self.v_max) & (triangular_matrix > self.v_min))
-        length_x = utils.calculate_lengt(min(self.molecule_coordinates, key=lambda x: x[0])[0],
-                                 max(self.molecule_coordinates, key=lambda x: x[0])[0])
-        length_y = utils.calculate_lengt(min(self.molecule_coordinates, key=lambda x: x[1])[1],
-                                 max(self.molecule_coordinates, key=lambda x: x[1])[1])
+        plt = rendering.pyplot()
+        low, high = self.molecule.bounding_box()
+        length_x = utils.calculate_lengt(low[0], high[0])
+        length_y = utils.calculate_lengt(low[1], high[1])
         aspect_ratio = round(length_x / length_y, 1)
         fig = plt.figure(figsize=(1.2*aspect_ratio, 0.8), dpi=250)
         ax = fig.add_axes([0.0, 0.0, 0.8, 1])
-        cmap = cm.get_cmap('cool')
+        cmap = plt.get_cmap('cool')
         norm = plt.Normalize(vmin=round(self.v_min, 2), vmax=round(self.v_max, 2))
-        for (i,j) in zip(indices[0],indices[1]):
-            x1, y1 = self.molecule_coordinates[:, 0][i], self.molecule_coordinates[:, 1][i]
-            x2, y2 = self.molecule_coordinates[:, 0][j], self.molecule_coordinates[:, 1][j]
-            bond_length = self.distance_matrix[i][j]
-            color_vazba = cmap(norm(bond_length))
-            ax.plot([x1, x2], [y1, y2], color=color_vazba)
-            mid_x, mid_y = (x1 + x2) / 2, (y1 + y2) / 2
-            ax.text(mid_x, mid_y, f'{bond_length:.2f}', fontsize=2, ha='center', va='center')
+        i, j, bond_length = self.bonds
+        rendering.draw_bonds(ax, self.molecule_coordinates, i, j, cmap(norm(bond_length)))
+        if rendering.show_labels(labels, len(i)):
+            rendering.draw_labels(ax, self.molecule_coordinates, i, j, bond_length, '{:.2f}', fontsize=2, ha='center', va='center')
         ax.set_aspect("equal")
         sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
         sm.set_array([])
@@ -59,29 +216,26 @@ class Bond_lenght_Analyzer:
         colorbar.set_label("Délka vazby", fontsize=4)
         colorbar.ax.tick_params(axis='y', labelsize=4)
         ax.axis('off')
-        plt.savefig(f"{self.file.split('.')[0]}_bond_length.png")
-        fig.show()
+        rendering.finish(fig, f"{self.file.split('.')[0]}_bond_length.png", block=False)
 
-    def projection_y_z_axis(self):
+    @stage
+    def projection_y_z_axis(self, labels = None):
         '''
         Generates 3D projections of bond lengths analysis viewed from the Y-axis and Z-axis.
+        :param labels: 'False' -> bonds are not labeled with their length, None -> only for small molecules
         '''
-        triangular_matrix = np.triu(self.distance_matrix, k=1)
-        indices = np.where((triangular_matrix < self.v_max) & (triangular_matrix > self.v_min))
+        plt = rendering.pyplot()
         fig = plt.figure(figsize=(8, 4), dpi=250)
         ax2 = fig.add_subplot(121, projection='3d')
         ax3 = fig.add_subplot(122, projection='3d')
-        cmap = cm.get_cmap('cool')
+        cmap = plt.get_cmap('cool')
         norm = plt.Normalize(vmin=round(self.v_min, 2), vmax=round(self.v_max, 2))
-        for (i, j) in zip(indices[0], indices[1]):
-            x1,y1,z1 = self.molecule_coordinates[:,0][i], self.molecule_coordinates[:, 1][i], self.molecule_coordinates[:, 2][i]
-            x2,y2,z2 = self.molecule_coordinates[:,0][j], self.molecule_coordinates[:, 1][j], self.molecule_coordinates[:, 2][j]
-            bond_length = self.distance_matrix[i][j]
-            bond_color = cmap(norm(bond_length))
-            ax2.plot([x1, x2], [y1, y2], [z1, z2], color=bond_color)
-            ax3.plot([x1, x2], [y1, y2], [z1, z2], color=bond_color)
-            mid_x, mid_y, mid_z = (x1 + x2) / 2, (y1 + y2) / 2, (z1 + z2) / 2
-            ax3.text(mid_x, mid_y, mid_z, f'{bond_length:.2f}', color='black', fontsize=8)
+        i, j, bond_length = self.bonds
+        bond_color = cmap(norm(bond_length))
+        rendering.draw_bonds(ax2, self.molecule_coordinates, i, j, bond_color)
+        rendering.draw_bonds(ax3, self.molecule_coordinates, i, j, bond_color)
+        if rendering.show_labels(labels, len(i)):
+            rendering.draw_labels(ax3, self.molecule_coordinates, i, j, bond_length, '{:.2f}', color='black', fontsize=8)
         ax2.view_init(elev=0, azim=90)
         ax3.view_init(elev=90, azim=0)
         ax2.set_title('View from Y-axis')
@@ -96,28 +250,21 @@ class Bond_lenght_Analyzer:
         colorbar = plt.colorbar(sm, label='Bond length', cax=cax)
         colorbar.set_label("Bond length", fontsize=10)
         colorbar.ax.tick_params(axis='y', labelsize=8)
-        plt.subplots_adjust(wspace=0)
-        plt.savefig(f"{self.file.split('.')[0]}bond_length_projection.png")
-        plt.show()
+        fig.subplots_adjust(wspace=0)
+        rendering.finish(fig, f"{self.file.split('.')[0]}bond_length_projection.png")
 
+    @stage
     def graf_3d(self):
         '''
         Generates a 3D graph depicting bond lengths in the molecule.
         '''
-        triangular_matrix = np.triu(self.distance_matrix, k=1)
-        indices = np.where((triangular_matrix < self.v_max) & (triangular_matrix > self.v_min))
+        plt = rendering.pyplot()
         fig = plt.figure(figsize=(6, 5),dpi=300)
         ax = fig.add_subplot(111, projection='3d')
-        cmap = cm.get_cmap('cool')
+        cmap = plt.get_cmap('cool')
         norm = plt.Normalize(vmin=round(self.v_min, 2), vmax=round(self.v_max, 2))
-        for (i, j) in zip(indices[0], indices[1]):
-            x1, y1, z1 = self.molecule_coordinates[:, 0][i], self.molecule_coordinates[:, 1][i], \
-            self.molecule_coordinates[:, 2][i]
-            x2, y2, z2 = self.molecule_coordinates[:, 0][j], self.molecule_coordinates[:, 1][j], \
-            self.molecule_coordinates[:, 2][j]
-            bond_length = self.distance_matrix[i][j]
-            length_color = cmap(norm(bond_length))
-            ax.plot([x1, x2], [y1, y2], [z1, z2], color=length_color)
+        i, j, bond_length = self.bonds
+        rendering.draw_bonds(ax, self.molecule_coordinates, i, j, cmap(norm(bond_length)))
         ax.set_aspect("equal")
         ax.set_xticks([])
         ax.set_yticks([])
@@ -132,5 +279,4 @@ class Bond_lenght_Analyzer:
         colorbar.set_label("Bond length", fontsize=10)
         colorbar.ax.tick_params(axis='y', labelsize=8)
         ax.grid(False)
-        plt.savefig(f"{self.file.split('.')[0]}bond_length_3d_graph.png")
-        plt.show()
\ No newline at end of file
+        rendering.finish(fig, f"{self.file.split('.')[0]}bond_length_3d_graph.png")
\ No newline at end of file
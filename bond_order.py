@@ -0,0 +1,51 @@
+import numpy as np
+import scipy as scp
+
+
+def occupations(electron_count):
+    '''
+    :param electron_count: number of pi electrons
+    :return: number of electrons in the occupied states sorted by energy - 2, ..., 2 and 1 for the singly occupied
+             state (SOMO) of a radical with an odd number of electrons
+    '''
+    weights = np.full((electron_count + 1) // 2, 2.0)
+    if electron_count % 2:
+        weights[-1] = 1.0
+    return weights
+
+def bond_order_matrix(eigenvectors, occupied_count = None, occupation = 2, weights = None):
+    '''
+    Computes the full Coulson bond-order (density) matrix from the occupied eigenvectors in one matrix product
+    P_ij = sum over occupied states of n_k * c_i * c_j
+    :param eigenvectors: matrix of eigenvectors (columns), sorted by increasing energy
+    :param occupied_count: number of occupied states - by default the lower half of the states (Huckel method)
+    :param occupation: number of electrons in one occupied state
+    :param weights: number of electrons in every occupied state (see 'occupations') - overrides occupied_count and occupation
+    :return: bond-order matrix (N x N), the diagonal holds the pi-electron density on the atoms
+    '''
+    if weights is not None:
+        occupied = eigenvectors[:, :len(weights)]
+        return (occupied * weights) @ occupied.T
+    if occupied_count is None:
+        occupied_count = int(eigenvectors.shape[0] / 2)
+    occupied = eigenvectors[:, :occupied_count]
+    return occupation * (occupied @ occupied.T)
+
+def pi_charges(bond_order):
+    '''
+    :param bond_order: Coulson bond-order matrix
+    :return: pi-electron density of the individual atoms (1 for every atom of a neutral alternant hydrocarbon)
+    '''
+    return np.diag(bond_order).copy()
+
+def bond_orders_between(bond_order, neighbours, minimal_distance, maximal_distance):
+    '''
+    Keeps only the bond orders of atom pairs (i < j) whose distance lies strictly between minimal and maximal distance
+    :param bond_order: Coulson bond-order matrix
+    :param neighbours: tuple of arrays (i, j, distance) - neighbour list of the molecule
+    :return: sparse (coo) upper triangular matrix of the bond orders of bonded atoms
+    '''
+    i, j, distance = neighbours
+    bonded = (distance < maximal_distance) & (distance > minimal_distance)
+    i, j = i[bonded], j[bonded]
+    return scp.sparse.coo_matrix((bond_order[i, j], (i, j)), shape=bond_order.shape)
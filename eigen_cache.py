@@ -0,0 +1,116 @@
+import hashlib
+import os
+import numpy as np
+
+
+class Eigen_cache:
+    '''
+    Persistent on-disk cache of eigenvalues and eigenvectors of Huckel Hamiltonians
+    Entries are addressed by a hash of the carbon coordinates and the Huckel parameters, stored as ".npy" files
+    and opened memory-mapped - a cached model of a large molecule is available without reading the whole matrix
+    When the total size exceeds the limit, the least recently used entries are removed
+    '''
+    def __init__(self, directory, max_size = 2 * 1024**3):
+        '''
+        :param directory: directory of the cache (created if it does not exist)
+        :param max_size: maximal total size of the cache in bytes
+        '''
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(coordinates, *parameters):
+        '''
+        :param coordinates: coordinates of the molecule
+        :param parameters: parameters of the calculation (alfa, beta, extended_huckel, minimal_distance, maximal_distance, ...)
+        :return: key of the cache entry - hexadecimal hash
+        '''
+        coordinates = np.ascontiguousarray(coordinates, dtype=np.float64)
+        digest = hashlib.sha256(coordinates.tobytes())
+        digest.update(repr((coordinates.shape,) + tuple(parameters)).encode())
+        return digest.hexdigest()
+
+    def paths(self, key):
+        '''
+        :return: paths of the eigenvalue and eigenvector files of the entry
+        '''
+        return os.path.join(self.directory, f"{key}_values.npy"), os.path.join(self.directory, f"{key}_vectors.npy")
+
+    def load(self, key):
+        '''
+        :return: tuple (eigenvalues, eigenvectors) - read-only memory-mapped arrays, None if the entry does not exist
+        '''
+        values_path, vectors_path = self.paths(key)
+        try:
+            eigenvalues = np.load(values_path, mmap_mode="r")
+            eigenvectors = np.load(vectors_path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+        '''
+        Update of the access time - least recently used entries are evicted first
+        '''
+        for path in (values_path, vectors_path):
+            os.utime(path)
+        return eigenvalues, eigenvectors
+
+    def store(self, key, eigenvalues, eigenvectors):
+        '''
+        Saves a new entry (written into a temporary file and renamed - safe for several processes sharing the cache)
+        and removes the least recently used entries if the size limit is exceeded
+        '''
+        for path, array in zip(self.paths(key), (eigenvalues, eigenvectors)):
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(temporary, path)
+        self.evict()
+
+    def entries(self):
+        '''
+        :return: list of (last access time, size in bytes, key) of all entries
+        '''
+        entries = {}
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npy"):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            key = name.rsplit("_", 1)[0]
+            access, size = entries.get(key, (0, 0))
+            entries[key] = (max(access, stat.st_mtime), size + stat.st_size)
+        return [(access, size, key) for key, (access, size) in entries.items()]
+
+    def size(self):
+        '''
+        :return: total size of the cache in bytes
+        '''
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        '''
+        Removes the least recently used entries until the cache fits into 'max_size'
+        '''
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_size:
+                break
+            self.remove(key)
+            total -= size
+
+    def remove(self, key):
+        '''
+        Removes the entry from the cache
+        '''
+        for path in self.paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        '''
+        Removes all entries of the cache
+        '''
+        for _, _, key in self.entries():
+            self.remove(key)
@@ -0,0 +1,86 @@
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import numpy as np
+import bond_order
+from huckel_model import Huckel_model
+from utils import load_coordinates, neighbour_list
+
+
+def parameter_grid(alfa = (0,), beta = (-2.8,), extended_huckel = (False,), minimal_distance = (1.10,), maximal_distance = (1.60,)):
+    '''
+    Creates all combinations of the Huckel parameters
+    :return: list of dictionaries with keys alfa, beta, extended_huckel, minimal_distance, maximal_distance
+    '''
+    return [{"alfa": a, "beta": b, "extended_huckel": e, "minimal_distance": v_min, "maximal_distance": v_max}
+            for a, b, e, v_min, v_max in itertools.product(alfa, beta, extended_huckel, minimal_distance, maximal_distance)]
+
+def result_dtype(file_length, number_of_states):
+    '''
+    :return: dtype of one row of the batch result table
+    '''
+    return np.dtype([("file", f"U{max(file_length, 1)}"), ("alfa", "f8"), ("beta", "f8"), ("extended_huckel", "?"),
+                     ("minimal_distance", "f8"), ("maximal_distance", "f8"), ("atoms", "i8"),
+                     ("gap", "f8"), ("homo", "f8"), ("lumo", "f8"), ("eigenvalues", "f8", (number_of_states,)),
+                     ("bond_order_mean", "f8"), ("bond_order_min", "f8"), ("bond_order_max", "f8")])
+
+def sweep_molecule(file, parameters, number_of_states):
+    '''
+    Evaluates all parameter combinations for one molecule
+    The geometry and the neighbour list are created only once. Both variants of the Huckel Hamiltonian are linear
+    in alfa and beta (H = alfa * 1 + beta * A), therefore only one diagonalisation of A is needed for every
+    (extended_huckel, minimal_distance, maximal_distance) - eigenvalues of the other variants are rescaled
+    :param file: file in ".xyz" format
+    :param parameters: list of parameter dictionaries (see 'parameter_grid')
+    :param number_of_states: number of eigenvalues around the Fermi energy stored in the result
+    :return: list of result rows (tuples in the order of 'result_dtype')
+    '''
+    coordinates = load_coordinates(file, carbon_only=True)
+    cutoff = max([p["maximal_distance"] for p in parameters] + [Huckel_model.skeleton_distance])
+    neighbours = neighbour_list(coordinates, cutoff)
+    half = int(number_of_states / 2)
+    models = {}
+    rows = []
+    for p in parameters:
+        key = (p["extended_huckel"], p["minimal_distance"], p["maximal_distance"])
+        if key not in models:
+            model = Huckel_model(coordinates, alfa=0, beta=1.0, extended_huckel=p["extended_huckel"],
+                                 minimal_distance=p["minimal_distance"], maximal_distance=p["maximal_distance"], neighbours=neighbours)
+            models[key] = (model, {})
+        model, bond_orders = models[key]
+        '''
+        Negative beta reverses the order of the states
+        '''
+        sign = 1 if p["beta"] >= 0 else -1
+        eigenvalues = p["alfa"] + p["beta"] * model.eigenvalues[::sign]
+        if sign not in bond_orders:
+            bond_charge = bond_order.bond_order_matrix(model.eigenvectors[:, ::sign], weights=bond_order.occupations(model.dimension))
+            bond_orders[sign] = bond_order.bond_orders_between(bond_charge, neighbours, p["minimal_distance"], p["maximal_distance"]).data
+        bonds = bond_orders[sign]
+        fermi = (len(eigenvalues) + 1) // 2
+        around_fermi = np.concatenate((np.full(half, np.nan), eigenvalues, np.full(half, np.nan)))[fermi:fermi + 2 * half]
+        rows.append((file, p["alfa"], p["beta"], p["extended_huckel"], p["minimal_distance"], p["maximal_distance"],
+                     model.dimension, eigenvalues[fermi] - eigenvalues[fermi - 1], eigenvalues[fermi - 1], eigenvalues[fermi],
+                     around_fermi, bonds.mean() if len(bonds) else np.nan, bonds.min() if len(bonds) else np.nan,
+                     bonds.max() if len(bonds) else np.nan))
+    return rows
+
+def huckel_batch(files, parameters = None, number_of_states = 2, workers = None):
+    '''
+    Huckel method for many molecules and parameter combinations - molecules are distributed over a process pool
+    :param files: list of files in ".xyz" format
+    :param parameters: list of parameter dictionaries (see 'parameter_grid'), by default the Huckel_model defaults
+    :param number_of_states: number of eigenvalues around the Fermi energy stored in the result (even number)
+    :param workers: number of processes, 1 -> everything is computed in the current process, None -> number of CPUs
+    :return: structured numpy array - one row for every (file, parameter combination)
+    '''
+    if parameters is None:
+        parameters = parameter_grid()
+    number_of_states = number_of_states + number_of_states % 2
+    files = list(files)
+    if workers == 1:
+        results = [sweep_molecule(file, parameters, number_of_states) for file in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(sweep_molecule, files, itertools.repeat(parameters), itertools.repeat(number_of_states)))
+    rows = [row for result in results for row in result]
+    return np.array(rows, dtype=result_dtype(max([len(file) for file in files] + [1]), number_of_states))
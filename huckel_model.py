@@ -1,18 +1,32 @@
-from utils import check_input_validity, load_coordinates, distance_matrix, calculate_lengt
-import matplotlib.pyplot as plt
+from utils import check_input_validity, calculate_lengt, element_codes
+from molecule import Molecule
+from instrumentation import stage
+import absorption
+import band_solver
+import bond_order
+import rendering
+import stm
+import symmetry
 import numpy as np
 import scipy as scp
-from matplotlib import cm
 
 class Huckel_model:
     '''
     Class implementing an approximate calculation of electronic structure and molecular orbitals using the Huckel method
     for 'pi'-conjugated planar (2D - x, y) molecules
     '''
-    def __init__(self, file, alfa = 0, beta = -2.8, extended_huckel = False, number_of_states = 0, minimal_distance = 1.10, maximal_distance = 1.60):
+    solvers = ("dense", "sparse", "banded", "symmetry", "none")
+    skeleton_distance = 1.7
+    symmetry_tolerance = 0.01
+
+    @stage(arrays=lambda self, *args, **kwargs: {"eigenvalues": self.eigenvalues, "eigenvectors": self._eigenvectors})
+    def __init__(self, file, alfa = 0, beta = -2.8, extended_huckel = False, number_of_states = 0, minimal_distance = 1.10, maximal_distance = 1.60, solver = "dense", neighbours = None, cache = None, parameters = None):
         '''
         :param file: File in ".xyz" format specifying the coordinates of the selected molecule
                      the program will only evaluate carbon atoms
+                     a Molecule (molecule.py) is also accepted - already loaded or constructed molecule, no file is read
+                     (graphs are saved under its name), an (N,2) array of carbon coordinates (graphs are saved as "molecule_...")
+                     or a tuple (element codes, coordinates) as returned by 'utils.read_geometry' (heteroatoms, see 'parameters')
         :param alpha: "on-site" energy of the atom - if the molecule contains the same type of atoms - without loss
                       of information, it can be set to 0
                       based on physical experiments - negative or zero value (calculation will proceed even for positive values)
@@ -29,6 +43,25 @@ class Huckel_model:
                              based on physical intuition - minimum value of carbon-carbon bond ~1.15
         :param max_distance: maximum distance between individual (usually neighboring) atoms that I want to visualize on the graph
                              based on physical intuition - maximum bond value ~1.55
+        :param solver: "dense" -> the whole spectrum is computed by dense diagonalisation (disconnected fragments separately)
+                       "sparse" -> the Hamiltonian is stored as a sparse matrix and only 'number_of_states' states around
+                       the Fermi energy (alfa) are computed (shift-invert) - suitable for large molecules
+                       the attributes eigenvalues, eigenvectors and state_names then contain only these states
+                       "banded" -> eigenvalues of the whole spectrum by the banded solver (atoms reordered by reverse
+                       Cuthill-McKee, O(N * bandwidth**2) for long ribbons), eigenvectors are computed only when they
+                       are first used (orbitals, bond charges) - fast gaps and energies of long ribbons
+                       "symmetry" -> the whole spectrum, the Hamiltonian is split into blocks of the irreducible
+                       representations of the in-plane symmetry of the molecule (D2h - 4 blocks, about 16x faster)
+                       "none" -> no eigenstates are computed (empty eigenvalues), only the Hamiltonian ('sparse_hamiltonian')
+                       is used - e.g. density of states of huge molecules (kpm.py)
+        :param neighbours: already computed neighbour list (i, j, distance) of the molecule (utils.neighbour_list) with cutoff
+                           at least maximal_distance - shared between several models of the same molecule
+                           (None -> the list cached in the Molecule, shared by all models of the same Molecule object)
+        :param cache: Eigen_cache (eigen_cache.py) - eigenvalues and eigenvectors of an already computed molecule
+                      with the same parameters are loaded from the disk instead of being computed again
+        :param parameters: Huckel_parameters (huckel_parameters.py) - heteroatoms: all atoms of elements with known
+                           parameters are kept, on-site energies alfa + h_X * beta, hoppings k_XY * beta and the occupation
+                           follows from the number of pi electrons; None -> carbon atoms only, one alfa and beta
         '''
         check_input_validity(alfa, "alfa", (int,float))
         check_input_validity(beta, "beta", (int,float))
@@ -36,18 +69,97 @@ class Huckel_model:
         check_input_validity(minimal_distance, "minimalni_vzdalenost", (int,float))
         check_input_validity(maximal_distance, "maximalni_vzdalenost", (int, float))
         check_input_validity(extended_huckel, "extenden_huckel", (bool))
-        self.file_name = file
-        self.molecule_coordinates = load_coordinates(file, carbon_only= True)
+        if solver not in Huckel_model.solvers:
+            raise ValueError(f"Parameter 'solver' must be one of {Huckel_model.solvers}")
+        if solver == "sparse" and number_of_states <= 0:
+            raise ValueError("Parameter 'number_of_states' must be positive for the 'sparse' solver")
+        self.parameters = parameters
+        if isinstance(file, Molecule):
+            molecule = file
+        elif isinstance(file, np.ndarray):
+            molecule = Molecule.carbon(file)
+        elif isinstance(file, tuple):
+            molecule = Molecule(*file)
+        else:
+            molecule = Molecule.from_file(file)
+        '''
+        Atoms of the model - views of the Molecule arrays (copied only if some atoms are removed)
+        '''
+        self.molecule = molecule.select_elements(parameters.element_codes if parameters is not None else element_codes["C"])
+        self.file_name = self.molecule.name
+        self.molecule_coordinates = self.molecule.coordinates[:, :2]
+        self.elements = self.molecule.elements
         self.dimension = len(self.molecule_coordinates)
+        self.electron_count = self.dimension if parameters is None else parameters.electron_count(self.elements)
+        if solver == "sparse" and (self.electron_count != self.dimension or np.any(self.on_site_energies(alfa, beta) != alfa)):
+            raise ValueError("The 'sparse' solver needs one pi electron per atom and on-site energies equal to alfa "
+                             "(states split evenly around alfa) - use solver 'dense'")
         self.number_of_states = number_of_states
-        self.distance = distance_matrix(self.molecule_coordinates)
-        self.eigenvalues, self.eigenvectors = self.create_hamiltonian(alfa, beta, extended_huckel, minimal_distance, maximal_distance)
-        self.state_names = Huckel_model.state_list(self.dimension)
+        self.solver = solver
+        if neighbours is None:
+            neighbours = self.molecule.neighbours(max(maximal_distance, Huckel_model.skeleton_distance))
+        self.neighbours = neighbours
+        self.alfa = alfa
+        self.beta = beta
+        self.extended_huckel = extended_huckel
         self.v_min = minimal_distance
         self.v_max = maximal_distance
+        self._eigenvectors = None
+        self._point_group = None
+        if cache is None or solver == "none":
+            '''
+            Solver "none" computes no states - nothing is loaded from or stored into the cache
+            '''
+            self.eigenvalues, self.eigenvectors = self.create_hamiltonian(alfa, beta, extended_huckel, minimal_distance, maximal_distance, solver)
+        else:
+            '''
+            The solver is a part of the key ("banded" shares the entries of "dense" - the same eigenvectors are stored,
+            "symmetry" stores symmetry-adapted ones), numbers are normalised (beta = -3 and -3.0 share an entry)
+            '''
+            cached_solver = "dense" if solver == "banded" else solver
+            key_parameters = (float(alfa), float(beta), bool(extended_huckel), float(minimal_distance),
+                              float(maximal_distance), cached_solver)
+            if solver == "sparse":
+                key_parameters = key_parameters + (int(number_of_states),)
+            if parameters is not None:
+                key_parameters = key_parameters + (self.elements.tobytes(), parameters.key())
+            key = cache.key(self.molecule_coordinates, *key_parameters)
+            cached = cache.load(key)
+            if cached is None:
+                '''
+                The cache stores all eigenvectors - they are computed also for the "banded" solver
+                '''
+                cached = self.create_hamiltonian(alfa, beta, extended_huckel, minimal_distance, maximal_distance,
+                                                 cached_solver)
+                cache.store(key, *cached)
+            self.eigenvalues, self.eigenvectors = cached
+        '''
+        Odd number of pi electrons (radical) - the highest occupied state holds one electron (SOMO)
+        '''
+        self.singly_occupied = self.electron_count % 2 == 1
+        if solver == "sparse":
+            self.occupied_count = int(len(self.eigenvalues)/2) + int(self.singly_occupied)
+        else:
+            self.occupied_count = (self.electron_count + 1) // 2
+        self.state_names = Huckel_model.state_list(len(self.eigenvalues), self.occupied_count, self.singly_occupied)
+        self._bond_charge_matrix = None
+        self._orbital_layout = None
+
+    @property
+    def eigenvectors(self):
+        '''
+        Eigenvectors (columns) in the order of 'eigenvalues' - with the "banded" solver computed at the first use
+        '''
+        if self._eigenvectors is None and self.solver == "banded":
+            self.eigenvalues, self._eigenvectors = band_solver.structured_eigh(self.sparse_hamiltonian())
+        return self._eigenvectors
+
+    @eigenvectors.setter
+    def eigenvectors(self, eigenvectors):
+        self._eigenvectors = eigenvectors
 
     @staticmethod
-    def state_list(list_length):
+    def state_list(list_length, occupied_count = None, singly_occupied = False):
         '''
         Function returns a list that will subsequently serve to describe individual states in output graphs
         Occupied states - from the highest (in terms of energy) occupied state indicated as HOMO ('Highest Occupied Molecular Orbital'), HOMO-1, ...
@@ -55,12 +167,19 @@ class Huckel_model:
         In the case of the Huckel method - the first half of the lowest eigenstates belongs to occupied states, the second half to unoccupied states
         :param list_length: number of eigenstates belonging to the Hamiltonian
                             for the Huckel method it is the number of carbon atoms
+        :param occupied_count: number of occupied states (default - half of the states)
+        :param singly_occupied: 'True' -> the highest occupied state holds one electron - named SOMO, HOMO is the highest
+                                doubly occupied state
         :return: list serving to describe individual states in output graphs
         '''
-        state_names = [f"HOMO-{int(list_length/2 -1 -i)}" if int(-list_length/2 +1 +i) < 0 else(
-                        "HOMO" if int(list_length/2 -1 -i) == 0 else(
-                        "LUMO" if (int(list_length/2 - i )) == 0 else
-                        f"LUMO+{int(-list_length/2 + i)}"))
+        if occupied_count is None:
+            occupied_count = int(list_length/2)
+        doubly_occupied = occupied_count - int(singly_occupied)
+        state_names = [f"HOMO-{doubly_occupied - 1 - i}" if i < doubly_occupied - 1 else(
+                        "HOMO" if i == doubly_occupied - 1 else(
+                        "SOMO" if i < occupied_count else(
+                        "LUMO" if i == occupied_count else
+                        f"LUMO+{i - occupied_count}")))
                         for i in range(int(list_length))]
 
         return state_names
@@ -71,49 +190,204 @@ class Huckel_model:
         '''
         if states % 2 == 1:
             states = states + 1
-        if states > len(self.molecule_coordinates):
-            states = len(self.molecule_coordinates)
-            print(f"I don't have that many eigenstates, I'll show {len(self.molecule_coordinates)}")
+        if states > len(self.eigenvalues):
+            states = len(self.eigenvalues)
+            print(f"I don't have that many eigenstates, I'll show {len(self.eigenvalues)}")
 
         return states
 
-    def create_hamiltonian(self, alfa, beta, extended_huckel, minimal_value, maximal_value):
+    @stage
+    def create_hamiltonian(self, alfa, beta, extended_huckel, minimal_value, maximal_value, solver = "dense"):
         '''
         Function creates the Hamiltonian based on the theory of the (Extended) Huckel method, also solves the problem of eigenvalues and states
         :return: eigenvalues and vectors of the constructed Huckel Hamiltonian
         '''
+        if solver == "none":
+            return np.zeros(0), np.zeros((self.dimension, 0))
+        hamiltonian = self.create_sparse_hamiltonian(alfa, beta, extended_huckel, minimal_value, maximal_value)
+        if solver == "sparse":
+            return self.states_around_fermi_level(hamiltonian, alfa)
+        if solver == "symmetry":
+            return symmetry.symmetry_eigh(hamiltonian, self.point_group())[:2]
+        '''
+        Disconnected fragments are diagonalised separately, the "banded" solver computes only the eigenvalues
+        (eigenvectors are computed at their first use - property 'eigenvectors')
+        '''
+        return band_solver.structured_eigh(hamiltonian, eigenvalues_only=solver == "banded")
+
+    def hopping_elements(self, beta, extended_huckel, minimal_value, maximal_value):
         '''
-        Size of Hamiltonian - square matrix, size corresponds to the number of carbon atoms
+        Function selects the neighbouring atoms (minimal_value <= distance <= maximal_value) from the neighbour list
+        With Huckel_parameters the hoppings are multiplied by k_XY looked up for all pairs at once
+        :return: indices i < j of the neighbouring atoms and the corresponding off-diagonal elements of the Hamiltonian
         '''
-        hamiltonian = np.zeros(self.dimension**2).reshape(self.dimension, self.dimension)
-        condition_1 = self.distance == 0
-        hamiltonian[condition_1] = alfa
-        condition_2 = (self.distance >= minimal_value) & (self.distance <= maximal_value)
+        i, j, distance = self.neighbours
+        bonded = (distance >= minimal_value) & (distance <= maximal_value)
         if extended_huckel:
-            hamiltonian[condition_2] = beta * (1.4/self.distance[condition_2])**2
+            hopping = beta * (1.4/distance[bonded])**2
         else:
-            hamiltonian[condition_2] = beta
+            hopping = np.full(int(np.sum(bonded)), float(beta))
+        if self.parameters is not None:
+            hopping = hopping * self.parameters.hopping_factors(self.elements[i[bonded]], self.elements[j[bonded]])
+        return i[bonded], j[bonded], hopping
+
+    def on_site_energies(self, alfa, beta):
+        '''
+        :return: diagonal of the Hamiltonian - alfa (carbon atoms only) or array alfa + h_X * beta (Huckel_parameters)
+        '''
+        if self.parameters is None:
+            return float(alfa)
+        return self.parameters.on_site_energies(self.elements, alfa, beta)
+
+    @stage
+    def create_sparse_hamiltonian(self, alfa, beta, extended_huckel, minimal_value, maximal_value):
+        '''
+        Function creates the same (Extended) Huckel Hamiltonian as 'create_hamiltonian' stored as a sparse matrix
+        :return: sparse (csr) Huckel Hamiltonian
+        '''
+        i, j, hopping = self.hopping_elements(beta, extended_huckel, minimal_value, maximal_value)
+        diagonal = np.arange(self.dimension)
+        rows = np.concatenate((i, j, diagonal))
+        columns = np.concatenate((j, i, diagonal))
+        values = np.concatenate((hopping, hopping, np.broadcast_to(self.on_site_energies(alfa, beta), self.dimension)))
+        return scp.sparse.csr_matrix((values, (rows, columns)), shape=(self.dimension, self.dimension))
+
+    def sparse_hamiltonian(self):
         '''
-        Vyřešení problému vlastních čísel právě zkontruovaného Hamiltoniánu
+        :return: sparse (csr) Hamiltonian of the model with the parameters given to the constructor
         '''
-        eigenvalues, eigenvectors = scp.linalg.eigh(a=hamiltonian)
-        return eigenvalues, eigenvectors
+        return self.create_sparse_hamiltonian(self.alfa, self.beta, self.extended_huckel, self.v_min, self.v_max)
 
+    def point_group(self):
+        '''
+        In-plane symmetry of the molecule (within 'symmetry_tolerance') restricted to the operations commuting with the Hamiltonian
+        :return: Point_group (symmetry.py) - Cs, C2h, C2v or D2h
+        '''
+        if self._point_group is None:
+            group = symmetry.detect_point_group(self.molecule_coordinates, self.elements, Huckel_model.symmetry_tolerance)
+            self._point_group = group.commuting(self.sparse_hamiltonian())
+        return self._point_group
+
+    def symmetry_labels(self):
+        '''
+        :return: list of irrep labels (e.g. "b2g") of the computed states in the order of 'eigenvalues'
+                 ("?" for degenerate states of different irreps mixed by a solver other than "symmetry")
+        '''
+        return self.point_group().labels(self.eigenvectors)
+
+    @staticmethod
+    def occupied_below(eigenvalues, fermi_energy, tolerance):
+        '''
+        Number of the given states occupied in the half-filled model - states closer to the Fermi energy than the tolerance
+        (zero modes of odd chains and non-Kekule molecules) are split evenly, the odd one stays unoccupied
+        '''
+        strictly_below = int(np.sum(eigenvalues < fermi_energy - tolerance))
+        zero_modes = int(np.sum(np.abs(eigenvalues - fermi_energy) <= tolerance))
+        return strictly_below + zero_modes // 2
+
+    @stage
+    def states_around_fermi_level(self, hamiltonian, fermi_energy, start_vector = None):
+        '''
+        Function computes only 'number_of_states' eigenstates closest to the Fermi energy (shift-invert mode)
+        Half of the states lies below the Fermi energy (HOMO, HOMO-1, ...) and half above it (LUMO, LUMO+1, ...) -
+        for the half-filled Huckel model the Fermi energy equals alfa (exact for alternant hydrocarbons)
+        The shift lies slightly above the Fermi energy - a zero mode exactly at alfa would make the factorisation singular
+        An odd number of electrons adds one state above - the singly occupied state (SOMO) and half of the states above it
+        :param start_vector: starting vector of the iteration (e.g. combination of eigenvectors of a similar geometry)
+        :return: eigenvalues and vectors of the selected states, sorted by energy
+        '''
+        states = self.number_of_states + self.number_of_states % 2
+        half = int(min(states, self.dimension)/2)
+        extra = self.electron_count % 2
+        k = min(states + extra + 4, self.dimension - 1)
+        tolerance = 1e-6 * max(abs(self.beta), 1.0)
+        shift = tolerance
+        while k < self.dimension - 1:
+            try:
+                eigenvalues, eigenvectors = scp.sparse.linalg.eigsh(hamiltonian, k=k, sigma=fermi_energy + shift, which="LM",
+                                                                    v0=start_vector)
+            except RuntimeError:
+                '''
+                Shift hit an eigenvalue - moved further from the Fermi energy (still far below the level spacing)
+                '''
+                if shift > 1e3 * tolerance:
+                    raise
+                shift *= 10
+                continue
+            order = np.argsort(eigenvalues)
+            below = Huckel_model.occupied_below(eigenvalues, fermi_energy, tolerance)
+            if below >= half and k - below >= half + extra:
+                selected = order[below - half:below + half + extra]
+                return eigenvalues[selected], eigenvectors[:, selected]
+            k = min(2 * k, self.dimension - 1)
+        '''
+        Small molecule - the whole spectrum is computed
+        '''
+        eigenvalues, eigenvectors = scp.linalg.eigh(a=hamiltonian.toarray())
+        below = Huckel_model.occupied_below(eigenvalues, fermi_energy, tolerance)
+        half = min(half, below, self.dimension - below - extra)
+        return eigenvalues[below - half:below + half + extra], eigenvectors[:, below - half:below + half + extra]
+
+    @stage
     def energy_graph(self):
         '''
         Representation of energies (eigenvalues) closest to the Fermi energy - number of states in the class parameter
         :return: Energy graph (eigenvalues) of the given Hamiltonian + representation of Fermi energy
         '''
+        plt = rendering.pyplot()
         how_many_states = self.how_many_states_to_draw(self.number_of_states)
-        for i in range(int(len(self.eigenvalues)/2)-(int(how_many_states/2)), int(len(self.eigenvalues)/2)+(int(how_many_states/2))):
-            plt.plot(self.state_names[i],self.eigenvalues[i], "ro")
-        plt.plot([self.state_names[int(len(self.eigenvalues)/2)-(int(how_many_states/2))],self.state_names[int(len(self.eigenvalues)/2)+(int(how_many_states/2))-1]],[0,0], color = "y", label = "Fermi level")
-        plt.legend()
-        plt.xlabel("Stavy")
-        plt.ylabel("Energie [eV]")
-        plt.savefig(f"{self.file_name.split('.')[0]}_energy.png")
-        plt.show()
+        first = max(self.occupied_count - int(how_many_states/2), 0)
+        last = min(self.occupied_count + int(how_many_states/2), len(self.eigenvalues))
+        fig = plt.figure()
+        ax = fig.add_subplot()
+        ax.plot(self.state_names[first:last], self.eigenvalues[first:last], "ro")
+        ax.plot([self.state_names[first],self.state_names[last-1]],[0,0], color = "y", label = "Fermi level")
+        ax.legend()
+        ax.set_xlabel("Stavy")
+        ax.set_ylabel("Energie [eV]")
+        rendering.finish(fig, f"{self.file_name.split('.')[0]}_energy.png")
 
+    def orbital_layout(self):
+        '''
+        Layout shared by all orbital graphs - computed only once for the molecule
+        :return: tuple (aspect ratio of the graph, marker size, indices i, j of the bonds of the skeleton)
+        '''
+        if self._orbital_layout is None:
+            low, high = self.molecule.bounding_box()
+            length_1 = calculate_lengt(low[0], high[0])
+            length_2 = calculate_lengt(low[1], high[1])
+            aspect_ratio = round(length_1/length_2, 1)
+            '''
+            Determining the markersize of the graph - to ensure visibility of corresponding orbitals (determined by trial and error)
+            '''
+            marker_size = round(0.1 * len(self.molecule_coordinates) + 10,1)
+            if marker_size < 25:
+                marker_size = 30
+            elif marker_size > 100:
+                marker_size = 100
+            i_list, j_list, distance = self.neighbours
+            skeleton = distance < Huckel_model.skeleton_distance
+            self._orbital_layout = (aspect_ratio, marker_size, i_list[skeleton], j_list[skeleton])
+        return self._orbital_layout
+
+    def draw_orbital(self, ax, orbital, state):
+        '''
+        Draws the skeleton of the molecule (one line collection) and the orbital (one scatter) into the axes
+        :return: scatter of the orbital
+        '''
+        aspect_ratio, marker_size, i, j = self.orbital_layout()
+        rendering.draw_bonds(ax, self.molecule_coordinates, i, j, "grey")
+        '''
+        All atoms as one scatter - area of the marker (markersize**2) given by the orbital coefficient
+        '''
+        scatter = ax.scatter(self.molecule_coordinates[:, 0], self.molecule_coordinates[:, 1], s=(marker_size * np.abs(orbital))**2,
+                             c=np.where(np.asarray(orbital) > 0, "r", "g"), zorder=3)
+        ax.set_title(f"{state}")
+        ax.set_aspect("equal")
+        ax.axis('off')
+        return scatter
+
+    @stage
     def orbital_graph(self, orbital, state):
         '''
         Function that creates a graph for the selected orbital - resulting in a molecular orbital corresponding to the eigenvalue (energy)
@@ -121,89 +395,202 @@ class Huckel_model:
         :param state: Graph label - HOMO, LUMO,.. can also be a numerical value
         :return: graph of the selected molecular orbital
         '''
-        length_1 = calculate_lengt(np.min(self.molecule_coordinates[:, 0]), np.max(self.molecule_coordinates[:, 0]))
-        length_2 = calculate_lengt(np.min(self.molecule_coordinates[:, 1]), np.max(self.molecule_coordinates[:, 1]))
-        aspect_ratio = round(length_1/length_2, 1)
-        '''
-        Determining the markersize of the graph - to ensure visibility of corresponding orbitals (determined by trial and error)
-        '''
-        marker_size = round(0.1 * len(self.molecule_coordinates) + 10,1)
-        if marker_size < 25:
-            marker_size = 30
-        elif marker_size > 100:
-            marker_size = 100
+        plt = rendering.pyplot()
+        aspect_ratio = self.orbital_layout()[0]
         fig = plt.figure(figsize = (aspect_ratio,1.5))
         ax = fig.add_axes((0.0, 0.0, 1, 1))
-        for i in range(self.dimension):
-            for j in range(i+1,self.dimension):
-                if self.distance[i][j] < 1.7:
-                    ax.plot([self.molecule_coordinates[:,0][i], self.molecule_coordinates[:,0][j]],[self.molecule_coordinates[:,1][i],self.molecule_coordinates[:,1][j]],"grey")
-        for k in range(len(orbital)):
-            ax.plot(self.molecule_coordinates[:,0][k],self.molecule_coordinates[:,1][k], "ro" if orbital[k] > 0 else "go", markersize=marker_size * abs(orbital[k]))
-        ax.set_title(f"{state}")
-        ax.set_aspect("equal")
-        ax.axis('off')
-        fig.savefig(f"{self.file_name.split('.')[0]}_{state}.png")
-        fig.show()
+        self.draw_orbital(ax, orbital, state)
+        rendering.finish(fig, f"{self.file_name.split('.')[0]}_{state}.png", block=False)
+
+    def states_around_fermi(self):
+        '''
+        :return: indices of 'number_of_states' states around the Fermi energy
+        '''
+        how_many_states = self.how_many_states_to_draw(self.number_of_states)
+        return list(range(max(self.occupied_count - int(how_many_states/2), 0), min(self.occupied_count + int(how_many_states/2), len(self.eigenvalues))))
 
+    @stage
     def huckel_orbitaly(self):
         '''
         :return: Plotting selected number of orbitals around the Fermi energy
         '''
-        how_many_states = self.how_many_states_to_draw(self.number_of_states)
-        for i in range(int(len(self.molecule_coordinates)/2) - int(how_many_states/2), int(len(self.molecule_coordinates)/2) + int(how_many_states/2)):
+        for i in self.states_around_fermi():
             self.orbital_graph(self.eigenvectors[:, i], self.state_names[i])
 
+    @stage
+    def orbitals_graph(self, states = None, animation = False, interval = 500):
+        '''
+        Draws several orbitals from one layout - all orbitals in one multi-panel figure (one panel per orbital)
+        or as an animated sequence (".gif") in which only the sizes and colors of the atoms change
+        :param states: indices of the states (columns of 'eigenvectors'), by default 'number_of_states' states around the Fermi energy
+        :param animation: 'False' -> multi-panel figure "..._orbitals.png", 'True' -> animation "..._orbitals.gif"
+        :param interval: time between frames of the animation in milliseconds
+        '''
+        plt = rendering.pyplot()
+        if states is None:
+            states = self.states_around_fermi()
+        aspect_ratio, marker_size = self.orbital_layout()[:2]
+        if animation:
+            from matplotlib.animation import FuncAnimation, PillowWriter
+            fig = plt.figure(figsize = (aspect_ratio,1.5))
+            ax = fig.add_axes((0.0, 0.0, 1, 0.85))
+            scatter = self.draw_orbital(ax, self.eigenvectors[:, states[0]], self.state_names[states[0]])
+
+            def update(frame):
+                orbital = self.eigenvectors[:, states[frame]]
+                scatter.set_sizes((marker_size * np.abs(orbital))**2)
+                scatter.set_color(np.where(np.asarray(orbital) > 0, "r", "g"))
+                ax.set_title(f"{self.state_names[states[frame]]}")
+                return scatter,
+
+            file_name = f"{self.file_name.split('.')[0]}_orbitals.gif"
+            FuncAnimation(fig, update, frames=len(states), interval=interval).save(file_name, writer=PillowWriter(fps=1000 / interval))
+            if rendering.settings["headless"]:
+                plt.close(fig)
+            return file_name
+        fig, axes = plt.subplots(len(states), 1, figsize = (aspect_ratio, 1.5 * len(states)), squeeze=False)
+        for ax, state in zip(axes[:, 0], states):
+            self.draw_orbital(ax, self.eigenvectors[:, state], self.state_names[state])
+        file_name = f"{self.file_name.split('.')[0]}_orbitals.png"
+        rendering.finish(fig, file_name, block=False)
+        return file_name
+
+    def selected_states(self, states = None, energy_window = None):
+        '''
+        :param states: indices of the states (None -> HOMO if no energy window is given)
+        :param energy_window: tuple (lowest, highest energy) - all computed states in the window
+        :return: array of state indices
+        '''
+        if energy_window is not None:
+            return np.flatnonzero((self.eigenvalues >= energy_window[0]) & (self.eigenvalues <= energy_window[1]))
+        if states is None:
+            return np.array([self.occupied_count - 1])
+        return np.atleast_1d(states)
+
+    def orbital_images(self, states = None, height = 2.0, spacing = 0.1, margin = 3.0, cutoff = 6.0, workers = None, save = False):
+        '''
+        Real-space orbitals (sum of Slater p_z orbitals of the atoms) on a grid at a constant height above the molecule
+        :param states: indices of the states (default HOMO)
+        :param height: height of the image above the molecule [Angstrom]
+        :param spacing: distance of the grid points [Angstrom]
+        :param cutoff: in-plane distance beyond which an atom does not contribute [Angstrom]
+        :param workers: number of threads evaluating the tiles of the grid (None -> number of CPUs)
+        :param save: 'True' -> every orbital is saved as "<file>_<state>_orbital.png"
+        :return: tuple (x, y, array (states, len(y), len(x)) of the orbital amplitudes)
+        '''
+        states = self.selected_states(states)
+        x, y = stm.grid_axes(self.molecule_coordinates, spacing, margin)
+        images = stm.evaluate_grid(self.molecule_coordinates, self.eigenvectors[:, states], x, y, height, cutoff,
+                                   self.elements, workers=workers)
+        if save:
+            for state, image in zip(states, images):
+                limit = max(np.max(np.abs(image)), 1e-12)
+                stm.save_image(image / limit, x, y, f"{self.file_name.split('.')[0]}_{self.state_names[state]}_orbital.png",
+                               cmap="bwr", title=self.state_names[state])
+        return x, y, images
+
+    def stm_image(self, energy_window = None, states = None, height = 2.0, spacing = 0.1, margin = 3.0, cutoff = 6.0,
+                  workers = None, save = False):
+        '''
+        Constant-height STM image (Tersoff-Hamann) - local density of the states in the energy window (or of the chosen
+        states) at the height above the molecule, sum of |orbital|**2
+        :param energy_window: tuple (lowest, highest energy) e.g. (alfa - bias, alfa) for occupied states
+        :param states: indices of the states if no energy window is given (default HOMO)
+        other parameters - see 'orbital_images'
+        :param save: 'True' -> the image is saved as "<file>_stm.png"
+        :return: tuple (x, y, image (len(y), len(x)))
+        '''
+        states = self.selected_states(states, energy_window)
+        x, y = stm.grid_axes(self.molecule_coordinates, spacing, margin)
+        image = stm.evaluate_grid(self.molecule_coordinates, self.eigenvectors[:, states], x, y, height, cutoff,
+                                  self.elements, weights=np.ones(len(states)), workers=workers)
+        if save:
+            stm.save_image(image, x, y, f"{self.file_name.split('.')[0]}_stm.png")
+        return x, y, image
+
+    def absorption_spectrum(self, energies = None, broadening = 0.1, shape = "gaussian", energy_window = None, top = 10,
+                            memory_limit = 256 * 2**20):
+        '''
+        Optical absorption spectrum from the transition dipoles of all occupied -> virtual pairs of the computed states
+        ("sparse" solver - only the transitions between the states around the Fermi energy)
+        :param energies: uniform energy grid [eV] (None -> from 0 to the highest excitation energy)
+        :param broadening: sigma of the Gaussian / half width of the Lorentzian [eV]
+        :param shape: "gaussian" or "lorentzian"
+        :param energy_window: tuple (lowest, highest) excitation energy - other pairs are skipped
+        :param top: number of the strongest transitions in the table
+        :param memory_limit: memory of one block of occupied states [B]
+        :return: tuple (energies, spectrum, table of the strongest transitions - indices of 'eigenvalues' / 'state_names')
+        '''
+        return absorption.absorption_spectrum(self.eigenvalues, self.eigenvectors, self.molecule_coordinates, self.occupied_count,
+                                              energies, broadening, shape, energy_window, top, memory_limit)
+
     def return_gap_value(self):
         '''
         Energy difference between the 'highest' occupied and 'lowest' unoccupied orbital
         Energy difference determines the basic properties of the material in terms of conductivity
+        For a radical (odd number of pi electrons) the gap between the SOMO and the LUMO
         '''
-        return self.eigenvalues[(int(len(self.eigenvalues)/2))]-self.eigenvalues[(int(len(self.eigenvalues)/2)-1)]
+        return self.eigenvalues[self.occupied_count]-self.eigenvalues[self.occupied_count-1]
 
+    @stage
     def bond_charge(self):
-        bond_charge_matrix = np.zeros((len(self.eigenvectors), len(self.eigenvectors)))
-        for i in range(0, len(self.eigenvectors)):
-            for j in range(0, len(self.eigenvectors)):
-                A = np.zeros((len(self.eigenvectors), len(self.eigenvectors)))
-                A[i, j] = 1
-                for stav in range(0, int(len(self.eigenvectors) / 2)):
-                    bond_charge_matrix[i, j] = bond_charge_matrix[i, j] + 2 * np.dot(self.eigenvectors[:, stav], np.dot(A, self.eigenvectors[:, stav]))
-        return bond_charge_matrix
+        '''
+        Coulson bond-order matrix computed from the occupied eigenstates (lower 'occupied_count' states, one electron
+        in the SOMO of a radical)
+        The matrix is computed only once and reused by the other bond charge methods
+        :return: matrix of bond charges between atoms i,j
+        '''
+        if self.eigenvectors.shape[1] < self.dimension:
+            raise ValueError("Bond charges need all occupied states - use solver 'dense'")
+        if self._bond_charge_matrix is None:
+            self._bond_charge_matrix = bond_order.bond_order_matrix(self.eigenvectors, weights=bond_order.occupations(self.electron_count))
+        return self._bond_charge_matrix
+
+    def pi_charges(self):
+        '''
+        :return: pi-electron density of the individual carbon atoms (diagonal of the bond charge matrix)
+        '''
+        return bond_order.pi_charges(self.bond_charge())
+
+    def bond_charge_sparse(self):
+        '''
+        :return: sparse (coo) matrix of bond charges only between atoms within (minimal_distance, maximal_distance)
+        '''
+        return bond_order.bond_orders_between(self.bond_charge(), self.neighbours, self.v_min, self.v_max)
 
     def bong_charge_matrix_txt(self):
         bond_charge_matrix = self.bond_charge()
         np.savetxt(f"{self.file_name.split('.')[0]}_bond_charge.txt", bond_charge_matrix)
 
 
-    def graph_bond_charge(self):
-        bond_charge_matrix = self.bond_charge()
-        triangular_matrix = np.triu(self.distance, k=1)
-        indices = np.where((triangular_matrix < self.v_max) & (triangular_matrix > self.v_min))
-        delka_x = calculate_lengt(min(self.molecule_coordinates, key=lambda x: x[0])[0],
-                                 max(self.molecule_coordinates, key=lambda x: x[0])[0])
-        delka_y = calculate_lengt(min(self.molecule_coordinates, key=lambda x: x[1])[1],
-                                 max(self.molecule_coordinates, key=lambda x: x[1])[1])
+    @stage
+    def graph_bond_charge(self, labels = None):
+        '''
+        Graph of the bond charges between neighbouring atoms
+        :param labels: 'True' -> value of the bond charge is written on every bond (colored according to the strength)
+                       'False' -> bonds are colored according to the bond charge, without text (much faster for large molecules)
+                       None -> labels only for small molecules (rendering.show_labels)
+        '''
+        plt = rendering.pyplot()
+        bonds = self.bond_charge_sparse()
+        low, high = self.molecule.bounding_box()
+        delka_x = calculate_lengt(low[0], high[0])
+        delka_y = calculate_lengt(low[1], high[1])
         aspect_ratio = round(delka_x / delka_y, 1)
-        # Extract values from the original matrix corresponding to the indices
-        bond_charge_values = []
-        for (i, j) in zip(indices[0], indices[1]):
-            bond_charge_values.append(bond_charge_matrix[i, j])
+        bond_charge_values = bonds.data
         min_value = np.min(bond_charge_values)
         max_value = np.max(bond_charge_values)
-        cmap = cm.get_cmap('hot')
+        cmap = plt.get_cmap('hot')
         norm = plt.Normalize(vmin=min_value - 0.05, vmax=max_value + 0.15)
         fig = plt.figure(figsize=(2*aspect_ratio, 2*0.8), dpi=500)
         ax = fig.add_axes([0.0, 0.0, 0.8, 1])
-        for (i, j) in zip(indices[0], indices[1]):
-            x1, y1 = self.molecule_coordinates[:, 0][i], self.molecule_coordinates[:, 1][i]
-            x2, y2 = self.molecule_coordinates[:, 0][j], self.molecule_coordinates[:, 1][j]
-            color_text = cmap(norm(bond_charge_matrix[i, j]))
-            bond_charge_i_j = round(bond_charge_matrix[i][j], 3)
-            ax.plot([x1, x2], [y1, y2], color="grey", alpha=.3, linewidth=1)
-            mid_x, mid_y = (x1 + x2) / 2, (y1 + y2) / 2
-            ax.text(mid_x, mid_y, f'{bond_charge_i_j:.2f}', fontsize=10, ha='center', va='center', color=color_text,
-                    fontweight="bold")
+        colors = cmap(norm(bond_charge_values))
+        if rendering.show_labels(labels, len(bond_charge_values)):
+            rendering.draw_bonds(ax, self.molecule_coordinates, bonds.row, bonds.col, "grey", alpha=.3, linewidth=1)
+            rendering.draw_labels(ax, self.molecule_coordinates, bonds.row, bonds.col, bond_charge_values, '{:.2f}', fontsize=10,
+                                  ha='center', va='center', colors=colors, fontweight="bold")
+        else:
+            rendering.draw_bonds(ax, self.molecule_coordinates, bonds.row, bonds.col, colors, linewidth=2)
         ax.set_aspect("equal")
         ax.axis('off')
         sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
@@ -211,5 +598,4 @@ class Huckel_model:
         cax = fig.add_axes([0.8, 0.2, 0.03, 0.6])
         colorbar = plt.colorbar(sm, label='Strength', cax=cax)
         colorbar.ax.tick_params(axis='y', labelsize=10)
-        fig.savefig(f"{self.file_name.split('.')[0]}_bond_charge.png", dpi=500)
-        fig.show()
+        rendering.finish(fig, f"{self.file_name.split('.')[0]}_bond_charge.png", dpi=500, block=False)
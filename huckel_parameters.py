@@ -0,0 +1,74 @@
+from utils import periodic_table, element_codes
+import numpy as np
+
+'''
+Huckel parameters of heteroatoms (Streitwieser) - dimensionless, relative to the carbon parameters alfa and beta:
+on-site energy alfa_X = alfa + h_X * beta, hopping beta_XY = k_XY * beta (k_XY * beta * (1.4/distance)**2 for the extended method)
+N - substitutional (graphitic, pyrrole type) nitrogen with two pi electrons, B - boron with an empty p orbital
+'''
+
+default_on_site = {"C": 0.0, "N": 1.5, "B": -1.0, "O": 2.0, "S": 1.5}
+default_hopping = {("C", "C"): 1.0, ("C", "N"): 0.8, ("C", "B"): 0.7, ("C", "O"): 0.8, ("C", "S"): 0.6,
+                   ("N", "N"): 0.8, ("B", "N"): 0.7, ("B", "B"): 0.7}
+default_electrons = {"C": 1, "N": 2, "B": 0, "O": 2, "S": 2}
+
+
+class Huckel_parameters:
+    '''
+    Per-element on-site energies h_X, per-element-pair hoppings k_XY and numbers of pi electrons stored as lookup tables
+    indexed by element codes (index in 'utils.periodic_table') - the Hamiltonian of the whole molecule is assembled
+    by indexing the tables with the element codes of all atoms / bonded pairs at once
+    '''
+    def __init__(self, on_site = None, hopping = None, electrons = None):
+        '''
+        :param on_site: dictionary {element: h_X}, added to (replacing) the default values
+        :param hopping: dictionary {(element, element): k_XY}, added to (replacing) the default values
+        :param electrons: dictionary {element: number of pi electrons}, added to (replacing) the default values
+        '''
+        self.on_site = {**default_on_site, **(on_site or {})}
+        self.hopping = {**default_hopping, **(hopping or {})}
+        self.electrons = {**default_electrons, **(electrons or {})}
+        size = len(periodic_table)
+        self.on_site_table = np.full(size, np.nan)
+        self.hopping_table = np.full((size, size), np.nan)
+        self.electron_table = np.zeros(size, dtype=np.int64)
+        for element, value in self.on_site.items():
+            self.on_site_table[element_codes[element]] = value
+        for (first, second), value in self.hopping.items():
+            self.hopping_table[element_codes[first], element_codes[second]] = value
+            self.hopping_table[element_codes[second], element_codes[first]] = value
+        for element, value in self.electrons.items():
+            self.electron_table[element_codes[element]] = value
+        self.element_codes = np.flatnonzero(~np.isnan(self.on_site_table))
+
+    def key(self):
+        '''
+        :return: text describing all parameters (part of the key of Eigen_cache) - built from the float lookup tables,
+                 so 1 and 1.0 or the pairs ("C", "N") and ("N", "C") give the same key
+        '''
+        return (self.on_site_table.tobytes() + self.hopping_table.tobytes() + self.electron_table.tobytes()).hex()
+
+    def on_site_energies(self, elements, alfa, beta):
+        '''
+        :param elements: element codes of the atoms
+        :return: diagonal of the Hamiltonian - alfa + h_X * beta for every atom
+        '''
+        return alfa + self.on_site_table[elements] * beta
+
+    def hopping_factors(self, first, second):
+        '''
+        :param first, second: element codes of the bonded atoms (arrays of the same length)
+        :return: k_XY of every pair
+        '''
+        factors = self.hopping_table[first, second]
+        missing = np.isnan(factors)
+        if np.any(missing):
+            pairs = {(periodic_table[a], periodic_table[b]) for a, b in zip(first[missing], second[missing])}
+            raise ValueError(f"Missing Huckel hopping parameters for the pairs {sorted(pairs)}")
+        return factors
+
+    def electron_count(self, elements):
+        '''
+        :return: number of pi electrons of the molecule
+        '''
+        return int(np.sum(self.electron_table[elements]))
@@ -0,0 +1,106 @@
+from huckel_model import Huckel_model
+from molecule import Molecule
+import numpy as np
+import scipy as scp
+
+
+class Updatable_huckel_model(Huckel_model):
+    '''
+    Huckel model for a sequence of similar geometries (optimisation loops, MD frames)
+    The Hamiltonian is kept as a sparse matrix and only the elements belonging to moved atoms are changed,
+    the states around the Fermi energy are refreshed by the shift-invert iteration started from the previous eigenvectors
+    Only the solver "sparse" is incremental - the whole spectrum (solvers "dense", "banded", "symmetry") changes with every
+    moved atom and would be diagonalised again, O(N**3) per frame - use a new Huckel_model for every frame instead
+    '''
+    def __init__(self, file, alfa = 0, beta = -2.8, extended_huckel = False, number_of_states = 2, minimal_distance = 1.10, maximal_distance = 1.60, solver = "sparse", tolerance = 1e-6, parameters = None):
+        '''
+        :param number_of_states: number of refreshed states around the Fermi energy
+        :param solver: only "sparse" is accepted
+        :param tolerance: atoms moved by less than the tolerance (Angstrom) are considered unchanged
+        other parameters - see Huckel_model
+        '''
+        if solver != "sparse":
+            raise ValueError("Updatable_huckel_model refreshes the states incrementally only with solver 'sparse' - "
+                             "create a new Huckel_model for every geometry with the other solvers")
+        super().__init__(file, alfa, beta, extended_huckel, number_of_states, minimal_distance, maximal_distance, solver, parameters=parameters)
+        self.tolerance = tolerance
+        self.molecule_coordinates = np.array(self.molecule_coordinates, dtype=float)
+        self.hamiltonian = self.sparse_hamiltonian()
+
+    def edit_atoms(self, indices, coordinates):
+        '''
+        Moves the selected atoms to new positions and refreshes the eigenstates
+        :param indices: indices of the moved atoms
+        :param coordinates: new x, y coordinates of these atoms
+        '''
+        new_coordinates = self.molecule_coordinates.copy()
+        new_coordinates[indices] = np.asarray(coordinates)[:, :2]
+        self.update_coordinates(new_coordinates)
+
+    def update_coordinates(self, coordinates):
+        '''
+        Accepts new coordinates of all atoms (same atoms, same order) and refreshes the eigenstates
+        :param coordinates: (N,2) array of the new x, y coordinates
+        :return: indices of the atoms, which moved more than the tolerance
+        '''
+        '''
+        Own copy - the caller may reuse (and modify in place) the same buffer for the next frame
+        '''
+        coordinates = np.array(coordinates, dtype=float)[:, :2].copy()
+        if coordinates.shape != self.molecule_coordinates.shape:
+            raise ValueError("The number of atoms must not change - create a new model")
+        moved = np.flatnonzero(np.sqrt(np.sum((coordinates - self.molecule_coordinates)**2, axis=1)) > self.tolerance)
+        if len(moved) == 0:
+            return moved
+        old_i, old_j, old_hopping = self.hopping_elements(self.beta, self.extended_huckel, self.v_min, self.v_max)
+        self.molecule_coordinates = coordinates
+        self.molecule = Molecule(self.elements, np.column_stack((coordinates, self.molecule.coordinates[:, 2])), self.molecule.name)
+        self.update_neighbours(moved)
+        new_i, new_j, new_hopping = self.hopping_elements(self.beta, self.extended_huckel, self.v_min, self.v_max)
+        '''
+        Change of the Hamiltonian - only elements of the pairs containing a moved atom
+        '''
+        old_affected = np.isin(old_i, moved) | np.isin(old_j, moved)
+        new_affected = np.isin(new_i, moved) | np.isin(new_j, moved)
+        rows = np.concatenate((old_i[old_affected], old_j[old_affected], new_i[new_affected], new_j[new_affected]))
+        columns = np.concatenate((old_j[old_affected], old_i[old_affected], new_j[new_affected], new_i[new_affected]))
+        values = np.concatenate((-old_hopping[old_affected], -old_hopping[old_affected], new_hopping[new_affected], new_hopping[new_affected]))
+        change = scp.sparse.csr_matrix((values, (rows, columns)), shape=self.hamiltonian.shape)
+        self.hamiltonian = self.hamiltonian + change
+        self.hamiltonian.eliminate_zeros()
+        self.refresh_spectrum()
+        return moved
+
+    def update_neighbours(self, moved):
+        '''
+        Replaces the pairs of the neighbour list containing a moved atom - distances between the moved atoms
+        and all atoms are computed, the rest of the list is kept
+        '''
+        i, j, distance = self.neighbours
+        cutoff = max(self.v_max, Huckel_model.skeleton_distance)
+        kept = ~(np.isin(i, moved) | np.isin(j, moved))
+        moved_distance = np.sqrt(np.sum((self.molecule_coordinates[moved][:, None, :] - self.molecule_coordinates[None, :, :])**2, axis=2))
+        is_moved = np.zeros(self.dimension, dtype=bool)
+        is_moved[moved] = True
+        '''
+        Pair of two moved atoms is counted only once (a < b), the moved atom itself is excluded
+        '''
+        close = (moved_distance <= cutoff) & ~(is_moved[None, :] & (np.arange(self.dimension)[None, :] <= moved[:, None]))
+        a, b = np.nonzero(close)
+        first, second = np.minimum(moved[a], b), np.maximum(moved[a], b)
+        i = np.concatenate((i[kept], first))
+        j = np.concatenate((j[kept], second))
+        distance = np.concatenate((distance[kept], moved_distance[a, b]))
+        order = np.lexsort((j, i))
+        self.neighbours = (i[order], j[order], distance[order])
+
+    def refresh_spectrum(self):
+        '''
+        Recomputes the states around the Fermi energy of the changed Hamiltonian - shift-invert iteration started from
+        the previous eigenvectors (the new states lie in almost the same subspace, fewer iterations are needed)
+        '''
+        self._bond_charge_matrix = None
+        self._orbital_layout = None
+        self._point_group = None
+        self.eigenvalues, self.eigenvectors = self.states_around_fermi_level(self.hamiltonian, self.alfa,
+                                                                             start_vector=self.eigenvectors.sum(axis=1))
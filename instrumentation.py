@@ -0,0 +1,184 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import numpy as np
+
+'''
+Opt-in timing and memory instrumentation of the toolkit stages (loaders, Hamiltonian, bond orders, rendering)
+Usage: with Stage_recorder() as recorder: model = Huckel_model("molecule.xyz") ... recorder.to_chrome_trace("trace.json")
+Without an active recorder the instrumented functions only check one list - no measurable overhead
+'''
+
+recorders = []
+'''
+Stack of the running stages - one for every thread (stages running in a thread pool are nested under nothing,
+not under the stage running in another thread)
+'''
+_local = threading.local()
+'''
+tracemalloc counts the allocations of all threads and has one peak counter - memory is recorded only for stages of the
+main thread that did not overlap with any stage of another thread ([running, started] stages of the other threads)
+'''
+_other_threads = [0, 0]
+_other_threads_lock = threading.Lock()
+
+
+def stage_stack():
+    '''
+    :return: list of the running stages of the current thread ([start memory, peak memory] frames)
+    '''
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class Stage_recorder:
+    '''
+    Collects one event for every instrumented stage called while the recorder is active (context manager)
+    Event: dictionary {"name", "start" [s], "time" [s], "peak_memory" [B] (None if memory is not traced - also for
+                       stages of other threads than the main one and for stages running concurrently with them),
+                       "arrays" {name: {"shape", "nbytes"}}, "depth" (nesting level), "thread"}
+    '''
+    def __init__(self, memory = True, callback = None):
+        '''
+        :param memory: 'True' -> peak allocated memory of every stage is traced (tracemalloc - slows the program down)
+        :param callback: function called with every finished event (e.g. logging), events are kept in any case
+        '''
+        self.memory = memory
+        self.callback = callback
+        self.events = []
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        recorders.append(self)
+        return self
+
+    def __exit__(self, *exception):
+        recorders.remove(self)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def add(self, event):
+        self.events.append(event)
+        if self.callback is not None:
+            self.callback(event)
+
+    def summary(self):
+        '''
+        :return: dictionary {stage name: {"calls", "time", "peak_memory"}} - total time and maximal peak of every stage
+        '''
+        summary = {}
+        for event in self.events:
+            total = summary.setdefault(event["name"], {"calls": 0, "time": 0.0, "peak_memory": None})
+            total["calls"] += 1
+            total["time"] += event["time"]
+            if event["peak_memory"] is not None:
+                total["peak_memory"] = max(total["peak_memory"] or 0, event["peak_memory"])
+        return summary
+
+    def to_json(self, file):
+        '''
+        Writes all events and their summary into a JSON file
+        '''
+        with open(file, "w") as f:
+            json.dump({"events": self.events, "summary": self.summary()}, f, indent=1)
+
+    def to_chrome_trace(self, file):
+        '''
+        Writes the events in the Chrome trace format (chrome://tracing, Perfetto) - nested stages are shown as a flame graph
+        '''
+        trace = [{"name": event["name"], "ph": "X", "ts": event["start"] * 1e6, "dur": event["time"] * 1e6,
+                  "pid": os.getpid(), "tid": event["thread"],
+                  "args": {"peak_memory": event["peak_memory"], "arrays": event["arrays"]}} for event in self.events]
+        with open(file, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+
+def array_sizes(value, name = "result"):
+    '''
+    :return: dictionary {name: {"shape", "nbytes"}} of the numpy arrays (and sparse matrices) in the value
+             (tuples and lists are searched one level deep)
+    '''
+    if isinstance(value, np.ndarray):
+        return {name: {"shape": list(value.shape), "nbytes": int(value.nbytes)}}
+    if hasattr(value, "nnz") and hasattr(value, "shape"):
+        return {name: {"shape": list(value.shape), "nnz": int(value.nnz)}}
+    if isinstance(value, (tuple, list)) and len(value) <= 16:
+        sizes = {}
+        for index, item in enumerate(value):
+            if isinstance(item, np.ndarray) or hasattr(item, "nnz"):
+                sizes.update(array_sizes(item, f"{name}[{index}]"))
+        return sizes
+    return {}
+
+def stage(function = None, name = None, arrays = None):
+    '''
+    Decorator of an instrumented stage - usable as @stage or @stage(name=..., arrays=...)
+    :param name: name of the stage (default - 'Class.method' or 'module.function')
+    :param arrays: function (arguments of the call) -> dictionary {name: array} of arrays reported after the call
+                   (e.g. attributes created by __init__), arrays returned by the function are reported automatically
+    '''
+    if function is None:
+        return lambda function: stage(function, name, arrays)
+    stage_name = name or (function.__qualname__ if "." in function.__qualname__ else f"{function.__module__}.{function.__qualname__}")
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not recorders:
+            return function(*args, **kwargs)
+        stack = stage_stack()
+        main = threading.current_thread() is threading.main_thread()
+        with _other_threads_lock:
+            if not main:
+                _other_threads[0] += 1
+                _other_threads[1] += 1
+            concurrent = _other_threads[0] > 0
+            started = _other_threads[1]
+        tracing = main and tracemalloc.is_tracing()
+        if tracing:
+            '''
+            Peak of the running (parent) stage is saved before the peak counter is reset for this stage
+            '''
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            frame = [current, current]
+        else:
+            frame = [0, 0]
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            with _other_threads_lock:
+                if not main:
+                    _other_threads[0] -= 1
+                concurrent = concurrent or _other_threads[0] > 0 or _other_threads[1] != started
+            peak_memory = None
+            if tracing and tracemalloc.is_tracing():
+                frame[1] = max(frame[1], tracemalloc.get_traced_memory()[1])
+                if not concurrent:
+                    peak_memory = frame[1] - frame[0]
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], frame[1])
+        sizes = array_sizes(result)
+        if arrays is not None:
+            for array_name, value in arrays(*args, **kwargs).items():
+                sizes.update(array_sizes(value, array_name))
+        event = {"name": stage_name, "start": start, "time": duration, "peak_memory": peak_memory,
+                 "arrays": sizes, "depth": len(stack), "thread": threading.get_ident()}
+        for recorder in list(recorders):
+            recorder.add(event)
+        return result
+    return wrapper
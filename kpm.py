@@ -0,0 +1,159 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+import scipy as scp
+from instrumentation import stage
+
+'''
+Density of states (DOS) and local density of states (LDOS) of huge molecules by the kernel polynomial method (KPM)
+The spectrum is expanded into Chebyshev polynomials of the scaled Hamiltonian - only products of the sparse Hamiltonian
+with a few vectors are needed, time and memory grow linearly with the number of bonds (no diagonalisation)
+Usage: model = Huckel_model("flake.xyz", solver="none"); energies, dos = density_of_states(model.sparse_hamiltonian())
+'''
+
+
+def spectral_bounds(hamiltonian):
+    '''
+    Bounds of the spectrum by the Gershgorin circle theorem (one pass over the non-zero elements)
+    :return: tuple (lowest, highest) energy
+    '''
+    hamiltonian = scp.sparse.csr_matrix(hamiltonian)
+    diagonal = hamiltonian.diagonal()
+    radius = np.asarray(abs(hamiltonian).sum(axis=1)).ravel() - np.abs(diagonal)
+    return float(np.min(diagonal - radius)), float(np.max(diagonal + radius))
+
+def scaled_hamiltonian(hamiltonian, margin = 0.01):
+    '''
+    Scales the Hamiltonian into the interval (-1, 1) of the Chebyshev polynomials: H' = (H - center) / half_width
+    :param margin: relative reserve of the interval (the Gershgorin bounds are not exceeded even numerically)
+    :return: tuple (scaled csr matrix, center, half_width)
+    '''
+    lowest, highest = spectral_bounds(hamiltonian)
+    center = (highest + lowest) / 2
+    half_width = max((highest - lowest) / 2, 1e-12) / (1 - margin)
+    identity = scp.sparse.identity(hamiltonian.shape[0], format="csr")
+    return scp.sparse.csr_matrix((hamiltonian - center * identity) / half_width), center, half_width
+
+def chebyshev_moments(scaled, vectors, moment_count):
+    '''
+    Chebyshev moments <v|T_n(H')|v> of every column v - recursion T_(n+1) = 2 H' T_n - T_(n-1), two moments per product
+    (mu_2n = 2 <T_n|T_n> - mu_0, mu_2n+1 = 2 <T_n+1|T_n> - mu_1)
+    :param vectors: (N, columns) array of starting vectors
+    :return: (moment_count, columns) array of moments
+    '''
+    moments = np.zeros((moment_count, vectors.shape[1]))
+    previous = vectors
+    current = scaled @ vectors
+    moments[0] = np.sum(previous * previous, axis=0)
+    if moment_count > 1:
+        moments[1] = np.sum(previous * current, axis=0)
+    for n in range(1, (moment_count + 1) // 2):
+        moments[2 * n] = 2 * np.sum(current * current, axis=0) - moments[0]
+        following = 2 * (scaled @ current) - previous
+        if 2 * n + 1 < moment_count:
+            moments[2 * n + 1] = 2 * np.sum(following * current, axis=0) - moments[1]
+        previous, current = current, following
+    return moments
+
+def random_vector_moments(scaled, moment_count, blocks):
+    '''
+    Sum of the moments of random vectors (+1/-1 elements) - stochastic estimate of (number of vectors) * tr T_n(H')
+    :param blocks: list of (number of vectors, seed) - vectors of one block are generated and multiplied together
+                   (memory of a few blocks of vectors of the size N)
+    '''
+    total = np.zeros(moment_count)
+    for count, seed in blocks:
+        vectors = np.random.default_rng(seed).choice(np.array([-1.0, 1.0]), size=(scaled.shape[0], count))
+        total += chebyshev_moments(scaled, vectors, moment_count).sum(axis=1)
+    return total
+
+def jackson_kernel(moment_count):
+    '''
+    Jackson damping factors g_n - remove the Gibbs oscillations of the truncated expansion
+    (energy resolution about pi * half_width / moment_count)
+    '''
+    n = np.arange(moment_count)
+    q = np.pi / (moment_count + 1)
+    return ((moment_count - n + 1) * np.cos(q * n) + np.sin(q * n) / np.tan(q)) / (moment_count + 1)
+
+def reconstruct(moments, energies, center, half_width):
+    '''
+    Density from the Chebyshev moments (Jackson kernel) on the energy grid
+    :param moments: (moment_count,) or (moment_count, K) array of normalised moments
+    :return: density at the energies - (E,) or (K, E) array, zero outside of the spectrum bounds
+    '''
+    x = (np.asarray(energies, dtype=float) - center) / half_width
+    inside = np.abs(x) < 1
+    coefficients = jackson_kernel(len(moments)).reshape((-1,) + (1,) * (moments.ndim - 1)) * moments
+    coefficients[1:] *= 2
+    density = np.zeros(moments.shape[1:] + x.shape)
+    density[..., inside] = np.polynomial.chebyshev.chebval(x[inside], coefficients) / (np.pi * np.sqrt(1 - x[inside]**2) * half_width)
+    return density
+
+def energy_grid(center, half_width, points = 1000):
+    return np.linspace(center - half_width, center + half_width, points)
+
+@stage
+def density_of_states(hamiltonian, moment_count = 512, random_vectors = 64, energies = None, workers = None, seed = 0,
+                      block = 8):
+    '''
+    Total density of states by KPM with stochastic trace estimation, random vectors are distributed over a process pool
+    :param hamiltonian: sparse Hamiltonian (e.g. Huckel_model.sparse_hamiltonian())
+    :param moment_count: number of Chebyshev moments (energy resolution)
+    :param random_vectors: number of random vectors (statistical error ~ 1/sqrt(random_vectors * N))
+    :param energies: energy grid, None -> 1000 points over the whole spectrum
+    :param workers: number of processes, None -> number of CPUs, 1 -> computed in this process
+    :param seed: seed of the random vectors (the result does not depend on the number of workers)
+    :param block: number of random vectors multiplied by the Hamiltonian together (one sparse matrix - dense block product)
+    :return: tuple (energies, DOS per atom - states / eV / atom, the integral over all energies is 1)
+    '''
+    scaled, center, half_width = scaled_hamiltonian(hamiltonian)
+    counts = [min(block, random_vectors - start) for start in range(0, random_vectors, block)]
+    blocks = list(zip(counts, np.random.SeedSequence(seed).spawn(len(counts))))
+    workers = min(workers or os.cpu_count(), len(blocks))
+    if workers == 1:
+        total = random_vector_moments(scaled, moment_count, blocks)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(random_vector_moments, scaled, moment_count, blocks[worker::workers])
+                       for worker in range(workers)]
+            total = sum(future.result() for future in futures)
+    moments = total / (random_vectors * scaled.shape[0])
+    if energies is None:
+        energies = energy_grid(center, half_width)
+    return energies, reconstruct(moments, energies, center, half_width)
+
+@stage
+def local_density_of_states(hamiltonian, atoms, moment_count = 512, energies = None):
+    '''
+    Local density of states on the chosen atoms - exact moments <i|T_n(H')|i> (no random vectors)
+    :param atoms: indices of the atoms
+    :return: tuple (energies, LDOS - array (atoms, energies), the integral of every row is 1)
+    '''
+    scaled, center, half_width = scaled_hamiltonian(hamiltonian)
+    atoms = np.atleast_1d(atoms)
+    moments = np.zeros((moment_count, len(atoms)))
+    for start in range(0, len(atoms), 64):
+        chosen = atoms[start:start + 64]
+        vectors = np.zeros((scaled.shape[0], len(chosen)))
+        vectors[chosen, np.arange(len(chosen))] = 1.0
+        moments[:, start:start + len(chosen)] = chebyshev_moments(scaled, vectors, moment_count)
+    if energies is None:
+        energies = energy_grid(center, half_width)
+    return energies, reconstruct(moments, energies, center, half_width)
+
+def gap_region(energies, dos, fermi_energy = 0.0, threshold = 1e-3):
+    '''
+    Interval around the Fermi energy in which the DOS is below the threshold (the resolution is limited by the number of moments)
+    :return: tuple (lower edge, upper edge) of the gap, (fermi_energy, fermi_energy) if the DOS at the Fermi energy is above the threshold
+    '''
+    energies = np.asarray(energies)
+    empty = np.asarray(dos) < threshold * np.max(dos)
+    fermi = int(np.argmin(np.abs(energies - fermi_energy)))
+    if not empty[fermi]:
+        return float(fermi_energy), float(fermi_energy)
+    filled_below = np.flatnonzero(~empty[:fermi])
+    filled_above = np.flatnonzero(~empty[fermi:])
+    lower = energies[filled_below[-1]] if len(filled_below) else energies[0]
+    upper = energies[fermi + filled_above[0]] if len(filled_above) else energies[-1]
+    return float(lower), float(upper)
@@ -0,0 +1,132 @@
+import argparse
+import json
+import sys
+
+'''
+Command line interface of the Molecular-Insight_Toolkit - numerical results are printed, nothing is plotted
+(matplotlib is never imported)
+python mit.py huckel molecule.xyz --states 4 --extended
+python mit.py bonds molecule.xyz --dimension 3
+python mit.py build 1.4 1.4 3 10 molecule
+Exit code 0 - success, 1 - invalid input (missing file, wrong parameters), 2 - wrong command line
+'''
+
+
+def huckel(arguments):
+    from huckel_model import Huckel_model
+    from huckel_parameters import Huckel_parameters
+    model = Huckel_model(arguments.file, alfa=arguments.alfa, beta=arguments.beta, extended_huckel=arguments.extended,
+                         number_of_states=arguments.states, minimal_distance=arguments.min, maximal_distance=arguments.max,
+                         solver=arguments.solver, parameters=Huckel_parameters() if arguments.heteroatoms else None)
+    fermi = model.occupied_count
+    states = model.states_around_fermi() if arguments.states else []
+    result = {"atoms": model.dimension, "gap": float(model.return_gap_value()),
+              "homo": float(model.eigenvalues[fermi - 1]), "lumo": float(model.eigenvalues[fermi]),
+              "states": {model.state_names[state]: float(model.eigenvalues[state]) for state in states}}
+    if arguments.symmetry:
+        labels = model.symmetry_labels()
+        result["point_group"] = model.point_group().name
+        result["labels"] = {model.state_names[state]: labels[state] for state in states}
+    if arguments.bond_orders:
+        bonds = model.bond_charge_sparse()
+        result["bond_orders"] = [[int(i), int(j), float(value)] for i, j, value in zip(bonds.row, bonds.col, bonds.data)]
+    if arguments.json:
+        print(json.dumps(result))
+        return
+    print(f"atoms {result['atoms']}")
+    if arguments.symmetry:
+        print(f"point_group {result['point_group']}")
+    for name in ("gap", "homo", "lumo"):
+        print(f"{name} {result[name]:.6f}")
+    for name, energy in result["states"].items():
+        print(f"{name} {energy:.6f}" + (f" {result['labels'][name]}" if arguments.symmetry else ""))
+    for i, j, value in result.get("bond_orders", []):
+        print(f"{i} {j} {value:.6f}")
+
+def bonds(arguments):
+    from bond_length_analyzer import Bond_lenght_Analyzer
+    import numpy as np
+    analyzer = Bond_lenght_Analyzer(arguments.file, dimension=arguments.dimension, minimal_distance=arguments.min,
+                                    maximal_distance=arguments.max)
+    report = analyzer.bond_report(bins=arguments.bins)
+    i, j, length = report["i"], report["j"], report["length"]
+    summary = {"bonds": len(length), "mean": float(length.mean()) if len(length) else None,
+               "min": float(length.min()) if len(length) else None, "max": float(length.max()) if len(length) else None,
+               "mean_alternation": None if np.isnan(report["mean_alternation"]) else report["mean_alternation"],
+               "max_alternation": None if np.isnan(report["max_alternation"]) else report["max_alternation"]}
+    pairs = {name: {**values, "histogram": values["histogram"].tolist()} for name, values in report["pairs"].items()}
+    if arguments.json:
+        print(json.dumps({"summary": summary, "pairs": pairs, "bin_edges": report["bin_edges"].tolist(),
+                          "bonds": [[int(a), int(b), float(d)] for a, b, d in zip(i, j, length)]}))
+        return
+    if not arguments.summary:
+        for a, b, d in zip(i, j, length):
+            print(f"{a} {b} {d:.4f}")
+    for name, values in pairs.items():
+        print(f"{name} " + " ".join(f"{key} {values[key]:.4f}" if key != "count" else f"count {values[key]}"
+                                    for key in ("count", "mean", "std", "min", "max")))
+    print(" ".join(f"{name} {value:.4f}" if isinstance(value, float) else f"{name} {value}" for name, value in summary.items()))
+
+def build(arguments):
+    from molecule_constructor import Molecule_constructor
+    molecule = Molecule_constructor(arguments.length_inside, arguments.length_between, arguments.rings,
+                                    arguments.repetitions, arguments.file_name)
+    molecule.molecule_coordinates_to_xyz_file()
+    print(f"atoms {len(molecule.molecule_coordinates)}")
+    print(f"file {arguments.file_name}.xyz")
+
+def parser():
+    main_parser = argparse.ArgumentParser(prog="mit", description="Molecular-Insight_Toolkit")
+    commands = main_parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("huckel", help="Huckel gap, HOMO, LUMO and states around the Fermi energy")
+    command.add_argument("file", help="molecule in \".xyz\" or \".in\" format")
+    command.add_argument("--alfa", type=float, default=0.0)
+    command.add_argument("--beta", type=float, default=-2.8)
+    command.add_argument("--extended", action="store_true", help="extended Huckel method - beta * (1.4/distance)**2")
+    command.add_argument("--states", type=int, default=0, help="number of printed states around the Fermi energy")
+    command.add_argument("--min", type=float, default=1.10, help="minimal bond length")
+    command.add_argument("--max", type=float, default=1.60, help="maximal bond length")
+    command.add_argument("--solver", choices=("dense", "sparse", "banded", "symmetry"), default="dense",
+                         help="banded - fast eigenvalues of long ribbons (bond orders computed with all eigenvectors), "
+                              "symmetry - blocks of the irreducible representations of the in-plane symmetry")
+    command.add_argument("--heteroatoms", action="store_true", help="keep N, B, O, S atoms (default Huckel_parameters)")
+    command.add_argument("--symmetry", action="store_true", help="print the point group and irrep labels of the states")
+    command.add_argument("--bond-orders", action="store_true", help="print bond orders of the neighbouring atoms (i j value)")
+    command.add_argument("--json", action="store_true", help="print the result as JSON")
+    command.set_defaults(function=huckel)
+
+    command = commands.add_parser("bonds", help="bond lengths (i j length), statistics of element pairs and bond length alternation")
+    command.add_argument("file", help="molecule in \".xyz\" or \".in\" format")
+    command.add_argument("--dimension", type=int, choices=(2, 3), default=2)
+    command.add_argument("--min", type=float, default=1.35, help="minimal bond length")
+    command.add_argument("--max", type=float, default=2.0, help="maximal bond length")
+    command.add_argument("--bins", type=int, default=50, help="number of histogram bins of every element pair (JSON)")
+    command.add_argument("--summary", action="store_true", help="print only the summary")
+    command.add_argument("--json", action="store_true", help="print the result as JSON")
+    command.set_defaults(function=bonds)
+
+    command = commands.add_parser("build", help="build a molecule with Molecule_constructor and save it as \".xyz\"")
+    command.add_argument("length_inside", type=float)
+    command.add_argument("length_between", type=float)
+    command.add_argument("rings", type=int, help="number of benzene rings (odd)")
+    command.add_argument("repetitions", type=int, help="number of elementary cells")
+    command.add_argument("file_name", help="name of the created file (without \".xyz\")")
+    command.set_defaults(function=build)
+    return main_parser
+
+def main(arguments = None):
+    arguments = parser().parse_args(arguments)
+    try:
+        arguments.function(arguments)
+    except (OSError, ValueError, TypeError, IndexError, RuntimeError) as error:
+        '''
+        RuntimeError - failed calculation (singular factorisation or no convergence of the scipy eigensolvers)
+        '''
+        print(f"mit {arguments.command}: error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import numpy as np
+from utils import element_codes, neighbour_list, read_geometry, write_xyz
+
+
+class Molecule:
+    '''
+    Geometry of a molecule shared by Huckel_model, Bond_lenght_Analyzer, Molecule_constructor and Molecule_store:
+    contiguous (N,3) float64 coordinates and int8 element codes (index in 'utils.periodic_table')
+    Derived data (bounding box, neighbour lists, bonded pairs) is computed at the first use and cached -
+    the arrays must not be modified afterwards (create a new Molecule instead)
+    '''
+    __slots__ = ("coordinates", "elements", "name", "_bounding_box", "_neighbours")
+
+    def __init__(self, elements, coordinates, name = "molecule"):
+        '''
+        :param elements: element codes of the atoms
+        :param coordinates: (N,3) or (N,2) (z = 0) coordinates - not copied if already a contiguous float64 (N,3) array
+        :param name: name of the molecule - base of the names of the saved graphs
+        '''
+        coordinates = np.asarray(coordinates)
+        if coordinates.ndim != 2 or coordinates.shape[1] not in (2, 3):
+            raise ValueError("Coordinates must be an (N,2) or (N,3) array")
+        if coordinates.shape[1] == 2:
+            coordinates = np.column_stack((coordinates, np.zeros(len(coordinates))))
+        self.coordinates = np.ascontiguousarray(coordinates, dtype=np.float64)
+        self.elements = np.ascontiguousarray(elements, dtype=np.int8)
+        if self.elements.shape != (len(self.coordinates),):
+            raise ValueError("Every atom needs one element code")
+        self.name = name
+        self._bounding_box = None
+        self._neighbours = {}
+
+    @classmethod
+    def from_file(cls, file):
+        '''
+        :param file: file in ".xyz" or ".in" format
+        '''
+        return cls(*read_geometry(file), name=file)
+
+    @classmethod
+    def carbon(cls, coordinates, name = "molecule"):
+        '''
+        :return: Molecule of carbon atoms at the coordinates
+        '''
+        return cls(np.full(len(coordinates), element_codes["C"], dtype=np.int8), coordinates, name)
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def __repr__(self):
+        return f"Molecule({self.name!r}, {len(self)} atoms)"
+
+    def select(self, atoms):
+        '''
+        :param atoms: boolean mask or indices of the kept atoms
+        :return: Molecule of the selected atoms (the same object if all atoms are kept)
+        '''
+        atoms = np.asarray(atoms)
+        if atoms.dtype == bool and np.all(atoms):
+            return self
+        return Molecule(self.elements[atoms], self.coordinates[atoms], self.name)
+
+    def select_elements(self, codes):
+        '''
+        :param codes: element codes of the kept atoms
+        :return: Molecule of the atoms of these elements (the same object if nothing is removed)
+        '''
+        return self.select(np.isin(self.elements, codes))
+
+    def bounding_box(self):
+        '''
+        :return: tuple (lowest x, y, z, highest x, y, z) arrays
+        '''
+        if self._bounding_box is None:
+            if len(self):
+                self._bounding_box = (self.coordinates.min(axis=0), self.coordinates.max(axis=0))
+            else:
+                self._bounding_box = (np.zeros(3), np.zeros(3))
+        return self._bounding_box
+
+    def neighbours(self, cutoff, dimension = 2):
+        '''
+        Neighbour list (utils.neighbour_list) - a list computed with a larger cutoff is reused (filtered)
+        :param dimension: 2 -> distances in the x, y plane, 3 -> in space
+        :return: tuple of arrays (i, j, distance) sorted by i, j
+        '''
+        cached = self._neighbours.get(dimension)
+        if cached is None or cached[0] < cutoff:
+            cached = (cutoff, neighbour_list(self.coordinates[:, :dimension], cutoff))
+            self._neighbours[dimension] = cached
+        if cached[0] == cutoff:
+            return cached[1]
+        i, j, distance = cached[1]
+        close = distance <= cutoff
+        return i[close], j[close], distance[close]
+
+    def bonds(self, minimal_distance, maximal_distance, dimension = 2):
+        '''
+        :return: tuple of arrays (i, j, length) of the pairs with minimal_distance < distance < maximal_distance
+        '''
+        i, j, distance = self.neighbours(maximal_distance, dimension)
+        bonded = (distance > minimal_distance) & (distance < maximal_distance)
+        return i[bonded], j[bonded], distance[bonded]
+
+    def write_xyz(self, file = None):
+        '''
+        Writes the molecule into a file in ".xyz" format (default "<name>.xyz")
+        '''
+        write_xyz(file or f"{self.name.split('.')[0]}.xyz", self.elements, self.coordinates)
@@ -1,10 +1,12 @@
 from utils import calculate_lengt
+from molecule import Molecule
+from instrumentation import stage
+import rendering
 import math
-import matplotlib.pyplot as plt
-from matplotlib import cm
 import numpy as np
 
 class Molecule_constructor:
+    @stage(arrays=lambda self, *args, **kwargs: {"molecule_coordinates": self.molecule_coordinates})
     def __init__(self, length_inside, length_between, number_of_benzene_rings, repetition_count, file_name, **kwargs):
         '''
         :param length_inside (float): bond length with elementary cell
@@ -19,10 +21,21 @@ class Molecule_constructor:
         '''
         dictionary_kwarg = Molecule_constructor.check_kwargs_inputs(repetition_count, kwargs)
         dictionary_elementary_cells, dictionary_distances = Molecule_constructor.create_element_cell_database(length_inside, length_between, number_of_benzene_rings, repetition_count, dictionary_kwarg)
-        self.my_molecule = Molecule_constructor.coordinate_of_molecule(dictionary_elementary_cells, dictionary_distances, repetition_count)
+        self.molecule_coordinates = Molecule_constructor.coordinate_of_molecule(dictionary_elementary_cells, dictionary_distances, repetition_count)
         self.file_name = file_name
+        '''
+        Molecule shares the coordinate array - Huckel_model(constructor.molecule) and Bond_lenght_Analyzer(constructor.molecule)
+        need no ".xyz" file
+        '''
+        self.molecule = Molecule.carbon(self.molecule_coordinates, file_name)
         self.v_min, self.v_max = Molecule_constructor.min_max_distance(length_inside, length_between, kwargs)
 
+    @property
+    def my_molecule(self):
+        '''
+        Molecule in the original list format [["C", x, y, z], ...]
+        '''
+        return [["C", x, y, z] for x, y, z in self.molecule_coordinates.tolist()]
 
     @staticmethod
     def min_max_distance(length_1, length_2, dictionary):
@@ -47,8 +60,9 @@ class Molecule_constructor:
         only_one_cell = [x for x in range(repetition_count)]
         database = {}
         period_dictionary = {}
+        main_cell = Molecule_constructor.create_elementary_cell(inner_length, benzene_count)
         for element in only_one_cell:
-            database[element] = Molecule_constructor.create_elementary_cell(inner_length, benzene_count)
+            database[element] = main_cell
             period_dictionary[element] = 4 * inner_length + joining_length
         for value in dictionary.values():
             for order in value[3]:
@@ -89,26 +103,19 @@ class Molecule_constructor:
     def create_elementary_cell(bond_length, benzene_count):
         '''
         Creates a 'main' elementary cell
-        :return: list: Elementary cell
-        '''
-        base = []
-        base.append([-bond_length / 2, 0.0])
-        base.append([bond_length / 2, 0.0])
-        base.append([-bond_length, math.sqrt((bond_length * bond_length) - (bond_length / 2) * (bond_length / 2))])
-        base.append([bond_length, math.sqrt((bond_length * bond_length) - (bond_length / 2) * (bond_length / 2))])
-        elementary_cell = [i for i in base]
-        for k in range(len(base)):
-            for i in range(1, benzene_count + 1):
-                element = float(base[k][1]) + i * 2 * math.sqrt(
-                    (bond_length * bond_length) - (bond_length / 2) * (bond_length / 2))
-                if element <= (benzene_count * 2 + 0.5) * math.sqrt(
-                        (bond_length * bond_length) - (bond_length / 2) * (bond_length / 2)):
-                    elementary_cell.append([base[k][0], element])
-        elementary_cell.append([2 * bond_length, benzene_count * math.sqrt(
-            (bond_length * bond_length) - (bond_length / 2) * (bond_length / 2))])
-        elementary_cell.append([-2 * bond_length, benzene_count * math.sqrt(
-            (bond_length * bond_length) - (bond_length / 2) * (bond_length / 2))])
-        return elementary_cell
+        :return: np.array (n,2): Elementary cell
+        '''
+        height = math.sqrt((bond_length * bond_length) - (bond_length / 2) * (bond_length / 2))
+        base = np.array([[-bond_length / 2, 0.0], [bond_length / 2, 0.0], [-bond_length, height], [bond_length, height]])
+        '''
+        Every atom of the base is repeated upwards by 2 * height (rows of benzene rings) up to the top of the cell
+        '''
+        y = base[:, 1, None] + np.arange(1, benzene_count + 1) * 2 * height
+        x = np.broadcast_to(base[:, 0, None], y.shape)
+        inside = y <= (benzene_count * 2 + 0.5) * height
+        return np.concatenate((base,
+                               np.stack((x[inside], y[inside]), axis=1),
+                               [[2 * bond_length, benzene_count * height], [-2 * bond_length, benzene_count * height]]))
 
     @staticmethod
     def create_remaining_elementary_cells(bond_length_2, benzene_count_2, x_coordinate, center):
@@ -116,86 +123,58 @@ class Molecule_constructor:
         Creates remaining elementary cells
         :param x_coordinate: shift on x axis according to 'main' elementary cell
         :param center: shift one y axis according to 'main' alementary cell
-        :return: List of other elementary cell
+        :return: np.array (n,2): other elementary cell
         '''
         elementary_cell_2 = Molecule_constructor.create_elementary_cell(bond_length_2, benzene_count_2)
         y_shift = center - benzene_count_2 * math.sqrt((bond_length_2 * bond_length_2) - (bond_length_2 / 2) * (bond_length_2 / 2))
         x_shift = x_coordinate + 2 * bond_length_2
-        for i in range(len(elementary_cell_2)):
-            elementary_cell_2[i][1] = elementary_cell_2[i][1] + y_shift
-            elementary_cell_2[i][0] = elementary_cell_2[i][0] + x_shift
-        return elementary_cell_2
+        return elementary_cell_2 + [x_shift, y_shift]
 
     @staticmethod
     def coordinate_of_molecule(cell_units, period, molecule_length):
         '''
         Computes a cartesian coordinates of molecule defined by inputs
-        :return: list: Molecule coordinates
-        '''
-        translation = 0
-        molecule = []
-        for k in range(molecule_length):
-            for i in range(len(cell_units[k])):
-                molecule.append(["C", float(cell_units[k][i][0])+translation, float(cell_units[k][i][1]),0])
-            translation += period[k]
-        min_x = min(range(len(molecule)), key=lambda i: molecule[i][1])
-        molecule.pop(min_x)
-        max_x = max(range(len(molecule)), key=lambda i: molecule[i][1])
-        molecule.pop(max_x)
-        return molecule
+        Cells are shifted by the cumulative sum of the periods, the first atom with the minimal x coordinate
+        and the first atom with the maximal x coordinate are removed (ends of the molecule)
+        :return: np.array (N,3): Molecule coordinates
+        '''
+        cells = [cell_units[k] for k in range(molecule_length)]
+        translation = np.concatenate(([0.0], np.cumsum([period[k] for k in range(molecule_length)])[:-1]))
+        molecule = np.zeros((sum(len(cell) for cell in cells), 3))
+        molecule[:, :2] = np.concatenate(cells)
+        molecule[:, 0] += np.repeat(translation, [len(cell) for cell in cells])
+        molecule = np.delete(molecule, np.argmin(molecule[:, 0]), axis=0)
+        return np.delete(molecule, np.argmax(molecule[:, 0]), axis=0)
 
 
     def molecule_coordinates_to_xyz_file(self):
         '''
         Writes the molecule cartesian coordinates into .xyz file
         '''
-        length = len(self.my_molecule)
-        try:
-            f = open(f"{self.file_name.split('.')[0]}.xyz", "w")
-            f.write(f"{length}\n\n")
-            for a in range(len(self.my_molecule)):
-                for i in range(4):
-                    f.write(f"{self.my_molecule[a][i]}    ")
-                f.write("\n")
-            f.close()
-        except:
-            f = open(f"{self.file_name('.')[0]}.xyz", "a")
-            f.write(f"{length}\n\n")
-            for a in range(len(self.my_molecule)):
-                for i in range(4):
-                    f.write(f"{self.my_molecule[a][i]}    ")
-                f.write("\n")
-            f.close()
+        self.molecule.write_xyz()
 
+    @stage
     def show_graph(self):
         '''
         Shows the graph of the molecule
         '''
-        length_x = calculate_lengt(min(self.my_molecule, key=lambda x: x[1])[1],
-                                    max(self.my_molecule, key=lambda x: x[1])[1])
-        length_y = calculate_lengt(min(self.my_molecule, key=lambda x: x[2])[2],
-                                    max(self.my_molecule, key=lambda x: x[2])[2])
+        plt = rendering.pyplot()
+        coordinates = self.molecule_coordinates[:, :2]
+        low, high = self.molecule.bounding_box()
+        length_x = calculate_lengt(low[0], high[0])
+        length_y = calculate_lengt(low[1], high[1])
         aspect_ratio = round(length_x / length_y, 1)
         fig = plt.figure(figsize=(aspect_ratio, 1.5))
         axes1 = fig.add_axes([0.0, 0.0, 0.9, 1])
-        cmap = cm.get_cmap('cool')
+        cmap = plt.get_cmap('cool')
         norm = plt.Normalize(vmin=round(self.v_min, 2), vmax=round(self.v_max, 2))
-        length = len(self.my_molecule)
-        for i in range(length):
-            for k in range(i + 1, length):
-                x = abs(self.my_molecule[i][1] - self.my_molecule[k][1])
-                y = abs(self.my_molecule[i][2] - self.my_molecule[k][2])
-                distance = math.sqrt(x * x + y * y)
-                if distance + 0.01 >= 1.10 and distance - 0.01 <= 1.90:
-                    x_values = [self.my_molecule[i][1], self.my_molecule[k][1]]
-                    y_values = [self.my_molecule[i][2], self.my_molecule[k][2]]
-                    color = cmap(norm(distance))
-                    axes1.plot(x_values, y_values, color=color)
+        i, k, distance = self.molecule.neighbours(1.91)
+        bonded = (distance + 0.01 >= 1.10) & (distance - 0.01 <= 1.90)
+        rendering.draw_bonds(axes1, coordinates, i[bonded], k[bonded], cmap(norm(distance[bonded])))
         sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
         sm.set_array([])
         cax = fig.add_axes([0.9, 0.05, 0.01, 0.9])  # Adjust the position and width of the colorbar axis
         plt.colorbar(sm, label='Bond length', cax=cax)
         axes1.set_aspect('equal')
         axes1.axis('off')
-        fig.savefig(f"{self.file_name}.png", dpi=300)
-        plt.show()
+        rendering.finish(fig, f"{self.file_name}.png", dpi=300)
@@ -0,0 +1,152 @@
+import json
+import os
+import numpy as np
+from utils import element_codes, read_geometry
+from huckel_model import Huckel_model
+from molecule import Molecule
+from bond_length_analyzer import Bond_lenght_Analyzer
+
+
+class Molecule_store_writer:
+    '''
+    Writes many molecules into one packed binary store (directory):
+    coordinates of all molecules concatenated into one array, element codes into another one and an index of offsets
+    Every molecule can carry additional results (eigenvalues, bond orders, ...) - "fields" - stored in the same way
+    Usage: with Molecule_store_writer("store") as writer: writer.add(elements, coordinates, eigenvalues=...)
+    '''
+    def __init__(self, directory, dtype = np.float64):
+        '''
+        :param directory: directory of the store (created if it does not exist, an existing store is overwritten)
+        :param dtype: type of the stored coordinates - np.float64 or np.float32
+        '''
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        os.makedirs(directory, exist_ok=True)
+        self.coordinates = open(os.path.join(directory, "coordinates.bin"), "wb")
+        self.elements = open(os.path.join(directory, "elements.bin"), "wb")
+        self.offsets = [0]
+        self.fields = {}
+
+    def add(self, elements, coordinates, **fields):
+        '''
+        Appends one molecule
+        :param elements: element codes (index in 'utils.periodic_table')
+        :param coordinates: (N,3) array of x, y, z coordinates (or (N,2) - z = 0)
+        :param fields: results belonging to the molecule, e.g. eigenvalues=array - every field is stored as float64
+        :return: index of the molecule in the store
+        '''
+        coordinates = np.asarray(coordinates)
+        if coordinates.shape[1] == 2:
+            coordinates = np.column_stack((coordinates, np.zeros(len(coordinates))))
+        self.coordinates.write(np.ascontiguousarray(coordinates, dtype=self.dtype).tobytes())
+        self.elements.write(np.ascontiguousarray(elements, dtype=np.int8).tobytes())
+        self.offsets.append(self.offsets[-1] + len(coordinates))
+        index = len(self.offsets) - 2
+        for name, values in fields.items():
+            if name not in self.fields:
+                self.fields[name] = (open(os.path.join(self.directory, f"field_{name}.bin"), "wb"), [0] * (index + 1))
+            file, offsets = self.fields[name]
+            offsets.extend([offsets[-1]] * (index + 1 - len(offsets)))
+            values = np.ascontiguousarray(values, dtype=np.float64).ravel()
+            file.write(values.tobytes())
+            offsets.append(offsets[-1] + len(values))
+        return index
+
+    def add_file(self, file, **fields):
+        '''
+        Appends the molecule from a file in ".xyz" or ".in" format
+        :return: index of the molecule in the store
+        '''
+        return self.add(*read_geometry(file), **fields)
+
+    def close(self):
+        '''
+        Writes the index of the store - molecules without a value of some field get an empty array
+        '''
+        self.coordinates.close()
+        self.elements.close()
+        np.save(os.path.join(self.directory, "offsets.npy"), np.array(self.offsets, dtype=np.int64))
+        for name, (file, offsets) in self.fields.items():
+            file.close()
+            offsets.extend([offsets[-1]] * (len(self.offsets) - len(offsets)))
+            np.save(os.path.join(self.directory, f"field_{name}_offsets.npy"), np.array(offsets, dtype=np.int64))
+        with open(os.path.join(self.directory, "store.json"), "w") as f:
+            json.dump({"dtype": self.dtype.str, "molecules": len(self.offsets) - 1, "fields": sorted(self.fields)}, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+class Molecule_store:
+    '''
+    Read access to a store created by Molecule_store_writer
+    All arrays are memory-mapped - a molecule is a slice (view) of the packed arrays, nothing is copied or parsed
+    '''
+    def __init__(self, directory):
+        '''
+        :param directory: directory of the store
+        '''
+        self.directory = directory
+        with open(os.path.join(directory, "store.json"), "r") as f:
+            self.info = json.load(f)
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+        atoms = int(self.offsets[-1])
+        self.coordinates = np.memmap(os.path.join(directory, "coordinates.bin"), dtype=np.dtype(self.info["dtype"]), mode="r",
+                                     shape=(atoms, 3)) if atoms else np.zeros((0, 3))
+        self.elements = np.memmap(os.path.join(directory, "elements.bin"), dtype=np.int8, mode="r",
+                                  shape=(atoms,)) if atoms else np.zeros(0, dtype=np.int8)
+        self.fields = {}
+        for name in self.info["fields"]:
+            offsets = np.load(os.path.join(directory, f"field_{name}_offsets.npy"), mmap_mode="r")
+            size = int(offsets[-1])
+            values = np.memmap(os.path.join(directory, f"field_{name}.bin"), dtype=np.float64, mode="r",
+                               shape=(size,)) if size else np.zeros(0)
+            self.fields[name] = (values, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        '''
+        :return: tuple (element codes, (N,3) coordinates) of the molecule - views into the memory-mapped arrays
+        '''
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return self.elements[start:end], self.coordinates[start:end]
+
+    def field(self, name, index):
+        '''
+        :return: values of the field (e.g. eigenvalues) stored for the molecule
+        '''
+        values, offsets = self.fields[name]
+        return values[int(offsets[index]):int(offsets[index + 1])]
+
+    def carbon_coordinates(self, index):
+        '''
+        :return: (N,2) x, y coordinates of the carbon atoms (a view if the molecule contains only carbon atoms)
+        '''
+        elements, coordinates = self[index]
+        carbon = elements == element_codes["C"]
+        return coordinates[:, :2] if np.all(carbon) else coordinates[carbon, :2]
+
+    def molecule(self, index):
+        '''
+        :return: Molecule of the stored molecule - its arrays are views into the memory-mapped arrays (float64 store)
+        '''
+        return Molecule(*self[index], name=f"molecule_{index}")
+
+    def huckel_model(self, index, **parameters):
+        '''
+        :param parameters: parameters of Huckel_model (with 'parameters' - Huckel_parameters - heteroatoms are kept)
+        :return: Huckel_model of the molecule
+        '''
+        return Huckel_model(self.molecule(index), **parameters)
+
+    def bond_analyzer(self, index, dimension = 2, **parameters):
+        '''
+        :param parameters: parameters of Bond_lenght_Analyzer
+        :return: Bond_lenght_Analyzer of the molecule
+        '''
+        return Bond_lenght_Analyzer(self.molecule(index), dimension=dimension, **parameters)
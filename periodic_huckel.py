@@ -0,0 +1,130 @@
+from utils import check_input_validity
+from instrumentation import stage
+from molecule_constructor import Molecule_constructor
+import rendering
+import numpy as np
+
+
+class Periodic_huckel_model:
+    '''
+    Huckel method for an infinite (periodic) molecule created by repeating one elementary cell along a translation vector
+    Instead of diagonalising the whole (long) ribbon, a small Bloch Hamiltonian H(k) of the size of the elementary cell
+    is diagonalised for every k-point - the cost grows with the number of k-points, not with the length of the ribbon
+    '''
+    @stage(arrays=lambda self, *args, **kwargs: {"bands": self.bands})
+    def __init__(self, cell_coordinates, translation, alfa = 0, beta = -2.8, extended_huckel = False, k_points = 100, minimal_distance = 1.10, maximal_distance = 1.60):
+        '''
+        :param cell_coordinates: (n,2) array - x, y coordinates of the carbon atoms of the elementary cell
+        :param translation: translation vector (x, y) between neighbouring elementary cells
+        :param alfa, beta, extended_huckel, minimal_distance, maximal_distance: same meaning as in Huckel_model
+        :param k_points: number of k-points in the interval <-pi, pi) (k in units of 1/|translation|) - k = pi is the same
+                         point as k = -pi, an even number of k-points contains both k = 0 and the zone edge
+        '''
+        check_input_validity(alfa, "alfa", (int,float))
+        check_input_validity(beta, "beta", (int,float))
+        check_input_validity(k_points, "k_points", (int))
+        check_input_validity(extended_huckel, "extenden_huckel", (bool))
+        check_input_validity(minimal_distance, "minimal_distance", (int,float))
+        check_input_validity(maximal_distance, "maximal_distance", (int,float))
+        if k_points <= 0:
+            raise ValueError("Parameter 'k_points' must be positive")
+        if not minimal_distance < maximal_distance:
+            raise ValueError("Parameter 'minimal_distance' must be smaller than 'maximal_distance'")
+        self.cell_coordinates = np.asarray(cell_coordinates, dtype=float)[:, :2]
+        self.translation = np.asarray(translation, dtype=float)[:2]
+        if not np.linalg.norm(self.translation) > 0:
+            raise ValueError("Parameter 'translation' must be a non-zero vector")
+        self.dimension = len(self.cell_coordinates)
+        self.v_min = minimal_distance
+        self.v_max = maximal_distance
+        self.hoppings = self.create_hopping_matrices(alfa, beta, extended_huckel, minimal_distance, maximal_distance)
+        self.k = np.linspace(-np.pi, np.pi, k_points, endpoint=False)
+        self.bands = self.band_structure(self.k)
+
+    @classmethod
+    def from_constructor(cls, length_inside, length_between, number_of_benzene_rings, **kwargs):
+        '''
+        Periodic model of the ribbon built by Molecule_constructor from the 'main' elementary cell
+        (infinite limit of Molecule_constructor(length_inside, length_between, number_of_benzene_rings, repetition_count, ...))
+        :param kwargs: other parameters of Periodic_huckel_model
+        '''
+        cell = np.array(Molecule_constructor.create_elementary_cell(length_inside, number_of_benzene_rings))
+        return cls(cell, (4 * length_inside + length_between, 0.0), **kwargs)
+
+    def create_hopping_matrices(self, alfa, beta, extended_huckel, minimal_value, maximal_value):
+        '''
+        Hamiltonian blocks H_m between the elementary cell 0 and the cell shifted by m translations
+        :return: dictionary {m: (n x n) matrix} - only blocks containing at least one bond
+        '''
+        '''
+        Atoms of the cell may spread along the translation over more than one period - the farthest bonded image is
+        (extent of the cell along T + maximal_value) / |T| cells away
+        '''
+        period = np.linalg.norm(self.translation)
+        extent = np.ptp(self.cell_coordinates @ (self.translation / period)) if len(self.cell_coordinates) else 0.0
+        reach = int(np.ceil((extent + maximal_value) / period))
+        hoppings = {}
+        for m in range(-reach, reach + 1):
+            shifted = self.cell_coordinates + m * self.translation
+            distance = np.sqrt(np.sum((self.cell_coordinates[:, None, :] - shifted[None, :, :])**2, axis=2))
+            bonded = (distance >= minimal_value) & (distance <= maximal_value)
+            block = np.zeros((self.dimension, self.dimension))
+            if extended_huckel:
+                block[bonded] = beta * (1.4/distance[bonded])**2
+            else:
+                block[bonded] = beta
+            if m == 0:
+                np.fill_diagonal(block, alfa)
+            if np.any(block):
+                hoppings[m] = block
+        return hoppings
+
+    def bloch_hamiltonian(self, k):
+        '''
+        :param k: array of k-points
+        :return: array of Bloch Hamiltonians H(k) = sum_m H_m exp(i k m), shape (k-points, n, n)
+        '''
+        k = np.atleast_1d(k)
+        hamiltonian = np.zeros((len(k), self.dimension, self.dimension), dtype=complex)
+        for m, block in self.hoppings.items():
+            hamiltonian += np.exp(1j * k * m)[:, None, None] * block
+        return hamiltonian
+
+    def band_structure(self, k):
+        '''
+        Diagonalises the Bloch Hamiltonians of all k-points at once
+        :return: energies of the bands, shape (k-points, n), sorted at every k-point
+        '''
+        return np.linalg.eigvalsh(self.bloch_hamiltonian(k))
+
+    def return_gap_value(self):
+        '''
+        Band gap of the infinite molecule - difference between the minimum of the lowest unoccupied band
+        and the maximum of the highest occupied band (one pi-electron per carbon atom)
+        '''
+        occupied = int(self.dimension / 2)
+        return np.min(self.bands[:, occupied]) - np.max(self.bands[:, occupied - 1])
+
+    @stage
+    def band_graph(self, file_name = "molecule"):
+        '''
+        Graph of the band structure, occupied bands red, unoccupied bands blue
+        '''
+        plt = rendering.pyplot()
+        occupied = int(self.dimension / 2)
+        fig = plt.figure()
+        ax = fig.add_subplot()
+        '''
+        The zone edge k = -pi is drawn once more at k = pi (not a separate k-point)
+        '''
+        k = np.append(self.k, np.pi)
+        bands = np.vstack((self.bands, self.bands[:1]))
+        ax.plot(k, bands[:, :occupied], "r")
+        ax.plot(k, bands[:, occupied:], "b")
+        ax.axhline(0, color = "y", label = "Fermi level")
+        ax.set_xlim(-np.pi, np.pi)
+        ax.set_xticks([-np.pi, 0, np.pi], ["-π", "0", "π"])
+        ax.legend()
+        ax.set_xlabel("k")
+        ax.set_ylabel("Energie [eV]")
+        rendering.finish(fig, f"{file_name.split('.')[0]}_bands.png")
@@ -0,0 +1,127 @@
+from concurrent.futures import ProcessPoolExecutor
+import sys
+import numpy as np
+from instrumentation import stage
+
+settings = {"headless": False, "label_limit": 300}
+
+
+def pyplot():
+    '''
+    matplotlib is imported only when the first figure is drawn - numerical work (gaps, bond orders, command line)
+    does not pay for the import of matplotlib
+    :return: module matplotlib.pyplot
+    '''
+    import matplotlib.pyplot as plt
+    return plt
+
+def set_headless(headless = True):
+    '''
+    Switches the rendering mode of all plotting methods of the toolkit
+    'True' -> non-interactive backend (Agg), figures are only saved into files and closed afterwards
+              (suitable for servers and batch jobs - nothing blocks and no figure stays in memory)
+    'False' -> figures are saved and shown
+    '''
+    settings["headless"] = headless
+    if headless:
+        import matplotlib
+        if "matplotlib.pyplot" in sys.modules:
+            sys.modules["matplotlib.pyplot"].close("all")
+        matplotlib.use("Agg")
+
+def show_labels(labels, count):
+    '''
+    :param labels: 'True' / 'False' -> labels are (not) written, None -> only if there are at most settings["label_limit"]
+                   bonds (one text object per bond is the slowest part of a large graph)
+    :param count: number of bonds
+    '''
+    return count <= settings["label_limit"] if labels is None else labels
+
+def is_3d(ax):
+    '''
+    :return: 'True' for a 3D axes (projection='3d')
+    '''
+    return getattr(ax, "name", None) == "3d"
+
+def axes_coordinates(ax, coordinates):
+    '''
+    :return: coordinates matching the axes - x, y for a 2D axes, x, y, z (z = 0 for planar input) for a 3D axes
+    '''
+    if not is_3d(ax):
+        return coordinates[:, :2]
+    if coordinates.shape[1] == 2:
+        return np.column_stack((coordinates, np.zeros(len(coordinates))))
+    return coordinates
+
+def bond_segments(coordinates, i, j):
+    '''
+    :param coordinates: (N,2) or (N,3) coordinates of the molecule
+    :param i, j: indices of the bonded atoms
+    :return: array of bond segments (bonds x 2 x dimension) for Line(3D)Collection
+    '''
+    return np.stack((coordinates[i], coordinates[j]), axis=1)
+
+def draw_bonds(ax, coordinates, i, j, colors, **kwargs):
+    '''
+    Draws all bonds as one LineCollection (Line3DCollection for a 3D axes) instead of one line per bond
+    :return: created collection
+    '''
+    coordinates = axes_coordinates(ax, coordinates)
+    segments = bond_segments(coordinates, i, j)
+    if is_3d(ax):
+        from mpl_toolkits.mplot3d.art3d import Line3DCollection
+        collection = Line3DCollection(segments, colors=colors, **kwargs)
+        ax.add_collection3d(collection)
+        if len(coordinates):
+            ax.auto_scale_xyz(coordinates[:, 0], coordinates[:, 1], coordinates[:, 2])
+    else:
+        from matplotlib.collections import LineCollection
+        collection = LineCollection(segments, colors=colors, **kwargs)
+        ax.add_collection(collection)
+        ax.autoscale_view()
+    return collection
+
+def draw_labels(ax, coordinates, i, j, values, text_format, **kwargs):
+    '''
+    Writes values (bond lengths, bond charges) into the middle of the bonds
+    :param colors: optional - list of colors of the individual labels
+    '''
+    colors = kwargs.pop("colors", None)
+    coordinates = axes_coordinates(ax, coordinates)
+    middle = (coordinates[i] + coordinates[j]) / 2
+    for k, (position, value) in enumerate(zip(middle, values)):
+        if colors is not None:
+            kwargs["color"] = colors[k]
+        ax.text(*position, text_format.format(value), **kwargs)
+
+@stage
+def finish(fig, file_name, dpi = "figure", block = True):
+    '''
+    Saves the figure; in the headless mode the figure is closed, otherwise shown
+    :param block: 'True' -> plt.show() (waits until the window is closed), 'False' -> fig.show()
+    '''
+    plt = pyplot()
+    fig.savefig(file_name, dpi=dpi)
+    if settings["headless"]:
+        plt.close(fig)
+    elif block:
+        plt.show()
+    else:
+        fig.show()
+
+def run_task(task):
+    '''
+    :param task: tuple (function, arguments)
+    '''
+    function, arguments = task
+    return function(*arguments)
+
+def render_many(tasks, workers = None):
+    '''
+    Renders many figures in a pool of processes with the headless backend
+    :param tasks: list of (function, arguments) - e.g. [(Bond_lenght_Analyzer.graph_2d, (analyzer,)), ...]
+    :param workers: number of processes, None -> number of CPUs
+    :return: list of the values returned by the tasks
+    '''
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_headless) as executor:
+        return list(executor.map(run_task, tasks))
@@ -0,0 +1,138 @@
+from concurrent.futures import ProcessPoolExecutor
+import collections
+import copy
+import itertools
+import os
+import tempfile
+import numpy as np
+from huckel_model import Huckel_model
+from molecule_constructor import Molecule_constructor
+
+
+def substitution_sequences(cells, repetition_count, max_substitutions = 1):
+    '''
+    Generator of cell sequences - molecules in which up to 'max_substitutions' 'main' elementary cells are replaced
+    by one of the alternative cells (one sequence is created at a time)
+    :param cells: list of alternative elementary cells [length_inside, length_between, number_of_benzene_rings]
+    :param repetition_count: number of elementary cells of the molecule
+    :return: yields kwargs dictionaries for Molecule_constructor ({} - molecule without substitution)
+    '''
+    yield {}
+    for count in range(1, max_substitutions + 1):
+        for positions, chosen in itertools.product(itertools.combinations(range(1, repetition_count + 1), count),
+                                                   itertools.product(range(len(cells)), repeat=count)):
+            kwargs = {}
+            for position, cell in zip(positions, chosen):
+                kwargs.setdefault(f"cell{cell}", list(cells[cell]) + [[]])[3].append(position)
+            yield kwargs
+
+def enumerate_library(spec):
+    '''
+    Generator of all candidate molecules defined by the specification
+    :param spec: dictionary with lists of values "length_inside", "length_between", "number_of_benzene_rings",
+                 "repetition_count" and optionally
+                 "cells" - alternative elementary cells [length_inside, length_between, number_of_benzene_rings] and
+                 "max_substitutions" - maximal number of substituted cells in one molecule (see 'substitution_sequences')
+    :return: yields dictionaries of the parameters of Molecule_constructor (key "kwargs" - other elementary cells)
+    '''
+    cells = spec.get("cells", [])
+    for inside, between, rings, repetitions in itertools.product(spec["length_inside"], spec["length_between"],
+                                                                 spec["number_of_benzene_rings"], spec["repetition_count"]):
+        sequences = substitution_sequences(cells, repetitions, spec.get("max_substitutions", 1)) if cells else iter([{}])
+        for kwargs in sequences:
+            yield {"length_inside": inside, "length_between": between, "number_of_benzene_rings": rings,
+                   "repetition_count": repetitions, "kwargs": kwargs}
+
+def screen_candidate(candidate, alfa = 0, beta = -2.8, extended_huckel = False, bond_orders = True):
+    '''
+    Builds the molecule in memory (no ".xyz" file) and evaluates it with the Huckel method
+    :param candidate: dictionary of the parameters of Molecule_constructor (see 'enumerate_library')
+    :param bond_orders: 'False' -> only the gap is computed with the sparse solver (bond order columns are NaN)
+    :return: tuple (atoms, gap, homo, lumo, bond_order_mean, bond_order_min, bond_order_max)
+    '''
+    molecule = Molecule_constructor(candidate["length_inside"], candidate["length_between"], candidate["number_of_benzene_rings"],
+                                    candidate["repetition_count"], "molecule", **copy.deepcopy(candidate["kwargs"]))
+    model = Huckel_model(molecule.molecule, alfa=alfa, beta=beta, extended_huckel=extended_huckel,
+                         number_of_states=2, minimal_distance=float(molecule.v_min), maximal_distance=float(molecule.v_max),
+                         solver="dense" if bond_orders else "sparse")
+    fermi = model.occupied_count
+    bonds = model.bond_charge_sparse().data if bond_orders else np.zeros(0)
+    return (model.dimension, model.return_gap_value(), model.eigenvalues[fermi - 1], model.eigenvalues[fermi],
+            bonds.mean() if len(bonds) else np.nan, bonds.min() if len(bonds) else np.nan, bonds.max() if len(bonds) else np.nan)
+
+def screen_chunk(candidates, parameters):
+    '''
+    :return: list of results of 'screen_candidate' for a chunk of candidates
+    '''
+    return [screen_candidate(candidate, **parameters) for candidate in candidates]
+
+def result_dtype():
+    '''
+    :return: dtype of one row of the numeric results of 'screen_library' (parameters of the candidate and its results)
+    '''
+    return np.dtype([("length_inside", "f8"), ("length_between", "f8"), ("number_of_benzene_rings", "i8"),
+                     ("repetition_count", "i8"), ("atoms", "i8"), ("gap", "f8"), ("homo", "f8"), ("lumo", "f8"),
+                     ("bond_order_mean", "f8"), ("bond_order_min", "f8"), ("bond_order_max", "f8")])
+
+def write_chunk(chunk, future, dtype, rows_out, cells_out, count, width):
+    '''
+    Appends the results of one screened chunk to the temporary files of 'screen_library'
+    :param future: future of 'screen_chunk' for the chunk
+    :return: tuple (number of written rows, width of the longest cell description)
+    '''
+    rows = np.zeros(len(chunk), dtype=dtype)
+    for row, (candidate, result) in enumerate(zip(chunk, future.result())):
+        rows[row] = tuple(candidate[name] for name in dtype.names[:4]) + tuple(result)
+        cells = repr(candidate["kwargs"])
+        width = max(width, len(cells))
+        cells_out.write(cells + "\n")
+    rows_out.write(rows.tobytes())
+    return count + len(chunk), width
+
+def screen_library(spec, output_file, alfa = 0, beta = -2.8, extended_huckel = False, bond_orders = True, workers = None, chunk_size = 256):
+    '''
+    Generates the library defined by the specification and screens it with the Huckel method on a process pool
+    Candidates are streamed in chunks and the results of every chunk are appended to temporary files - neither the
+    library nor its results are held in memory, no ".xyz" files are written
+    :param spec: specification of the library (see 'enumerate_library')
+    :param output_file: ".npz" file - one column (array) for every parameter and result
+    :param workers: number of processes, None -> number of CPUs
+    :param chunk_size: number of candidates sent to a process at once
+    :return: number of screened candidates
+    '''
+    parameters = {"alfa": alfa, "beta": beta, "extended_huckel": extended_huckel, "bond_orders": bond_orders}
+    dtype = result_dtype()
+    candidates = enumerate_library(spec)
+    workers = workers or os.cpu_count()
+    with tempfile.TemporaryDirectory() as directory:
+        rows_file = os.path.join(directory, "rows.bin")
+        cells_file = os.path.join(directory, "cells.txt")
+        with ProcessPoolExecutor(max_workers=workers) as executor, open(rows_file, "wb") as rows_out, \
+                open(cells_file, "w") as cells_out:
+            '''
+            At most 2 * workers chunks are in flight - a new chunk is submitted as soon as the oldest one is written,
+            so the pool never waits for a whole batch and memory does not grow with the library
+            '''
+            chunks = iter(lambda: list(itertools.islice(candidates, chunk_size)), [])
+            pending = collections.deque()
+            count, width = 0, 1
+            for chunk in chunks:
+                pending.append((chunk, executor.submit(screen_chunk, chunk, parameters)))
+                if len(pending) >= 2 * workers:
+                    count, width = write_chunk(*pending.popleft(), dtype, rows_out, cells_out, count, width)
+            while pending:
+                count, width = write_chunk(*pending.popleft(), dtype, rows_out, cells_out, count, width)
+        '''
+        Columns are written into the ".npz" file from memory-mapped arrays (np.savez streams them in blocks)
+        '''
+        rows = np.memmap(rows_file, dtype=dtype, mode="r", shape=(count,)) if count else np.zeros(0, dtype=dtype)
+        cells = np.memmap(os.path.join(directory, "cells.bin"), dtype=f"U{width}", mode="w+", shape=(count,)) if count \
+            else np.zeros(0, dtype="U1")
+        with open(cells_file, "r") as cells_in:
+            for start in range(0, count, 65536):
+                block = [line.rstrip("\n") for line in itertools.islice(cells_in, 65536)]
+                cells[start:start + len(block)] = block
+        columns = {name: rows[name] for name in dtype.names}
+        np.savez(output_file, cells=cells, **columns)
+        del rows, cells, columns
+    return count
@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import numpy as np
+from instrumentation import stage
+from utils import element_codes
+import rendering
+
+'''
+Real-space images of Huckel orbitals on a 2D grid at a constant height above the molecule (x, y plane)
+Every atom carries a Slater p_z orbital  phi(r) = sqrt(zeta**5/pi) * z * exp(-zeta*|r|), an orbital is the sum of the atomic
+orbitals weighted by the eigenvector coefficients, the constant-height STM image (Tersoff-Hamann) is sum_n w_n |psi_n|**2
+The grid is evaluated in square tiles - only atoms within 'cutoff' of a tile contribute, tiles run on a thread pool
+(numpy releases the GIL in exp and in the matrix products)
+'''
+
+bohr = 0.529177
+'''
+Slater exponents of the 2p orbitals [1/bohr] (Slater's rules), 3p of sulphur as an approximation
+'''
+slater_exponents = {"B": 1.30, "C": 1.625, "N": 1.95, "O": 2.275, "S": 1.817}
+
+
+def atom_exponents(elements):
+    '''
+    :param elements: element codes of the atoms
+    :return: Slater exponents of the atoms [1/Angstrom] (carbon value for elements without a tabulated exponent)
+    '''
+    table = np.full(max(element_codes.values()) + 1, slater_exponents["C"] / bohr)
+    for element, exponent in slater_exponents.items():
+        table[element_codes[element]] = exponent / bohr
+    return table[np.asarray(elements)]
+
+def grid_axes(coordinates, spacing = 0.1, margin = 3.0):
+    '''
+    :param spacing: distance of the grid points [Angstrom]
+    :param margin: empty border around the molecule [Angstrom]
+    :return: tuple (x values, y values) of the grid covering the molecule
+    '''
+    low = np.min(coordinates[:, :2], axis=0) - margin
+    high = np.max(coordinates[:, :2], axis=0) + margin
+    return np.arange(low[0], high[0] + spacing / 2, spacing), np.arange(low[1], high[1] + spacing / 2, spacing)
+
+def tile_slices(x, y, tile):
+    '''
+    :return: list of (row slice, column slice) of the square tiles covering the grid
+    '''
+    return [(slice(row, min(row + tile, len(y))), slice(column, min(column + tile, len(x))))
+            for row in range(0, len(y), tile) for column in range(0, len(x), tile)]
+
+def tile_amplitudes(coordinates, order, sorted_x, coefficients, exponents, x, y, height, cutoff):
+    '''
+    Amplitudes of all orbitals in one tile - (pixels x atoms) matrix of atomic orbitals times (atoms x orbitals) coefficients
+    :param order, sorted_x: atoms sorted by the x coordinate (x range of the tile is found by bisection)
+    :return: (len(y), len(x), orbitals) array
+    '''
+    first, last = np.searchsorted(sorted_x, (x[0] - cutoff, x[-1] + cutoff))
+    atoms = order[first:last]
+    atoms = atoms[(coordinates[atoms, 1] >= y[0] - cutoff) & (coordinates[atoms, 1] <= y[-1] + cutoff)]
+    if len(atoms) == 0:
+        return np.zeros((len(y), len(x), coefficients.shape[1]))
+    pixels_x, pixels_y = np.meshgrid(x, y)
+    dx = pixels_x.reshape(-1, 1) - coordinates[atoms, 0]
+    dy = pixels_y.reshape(-1, 1) - coordinates[atoms, 1]
+    planar = dx * dx + dy * dy
+    distance = np.sqrt(planar + height * height)
+    zeta = exponents[atoms]
+    orbitals = np.sqrt(zeta**5 / np.pi) * height * np.exp(-zeta * distance)
+    orbitals[planar > cutoff * cutoff] = 0.0
+    return (orbitals @ coefficients[atoms]).reshape(len(y), len(x), -1)
+
+@stage
+def evaluate_grid(coordinates, coefficients, x, y, height = 2.0, cutoff = 6.0, elements = None, weights = None,
+                  tile = 64, workers = None):
+    '''
+    :param coordinates: (N,2) coordinates of the atoms
+    :param coefficients: (N, orbitals) eigenvector coefficients of the evaluated orbitals
+    :param x, y: grid axes (grid_axes)
+    :param height: height of the image plane above the molecule [Angstrom]
+    :param cutoff: atoms farther than the cutoff (in the plane) do not contribute to a grid point [Angstrom]
+    :param elements: element codes of the atoms (Slater exponents), None -> carbon
+    :param weights: None -> amplitudes of the orbitals are returned, array (orbitals,) -> sum of weights * |psi|**2
+    :param tile: edge of a tile [grid points] - memory of one tile ~ tile**2 * (atoms near the tile) * 8 B
+    :param workers: number of threads, None -> number of CPUs
+    :return: (orbitals, len(y), len(x)) amplitudes or (len(y), len(x)) image
+    '''
+    coordinates = np.asarray(coordinates, dtype=float)[:, :2]
+    coefficients = np.asarray(coefficients, dtype=float).reshape(len(coordinates), -1)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    exponents = atom_exponents(np.full(len(coordinates), element_codes["C"]) if elements is None else elements)
+    order = np.argsort(coordinates[:, 0], kind="stable")
+    sorted_x = coordinates[order, 0]
+    if weights is None:
+        result = np.zeros((coefficients.shape[1], len(y), len(x)))
+    else:
+        weights = np.asarray(weights, dtype=float)
+        result = np.zeros((len(y), len(x)))
+
+    def evaluate(tile_slice):
+        rows, columns = tile_slice
+        amplitudes = tile_amplitudes(coordinates, order, sorted_x, coefficients, exponents, x[columns], y[rows], height, cutoff)
+        if weights is None:
+            result[:, rows, columns] = np.moveaxis(amplitudes, 2, 0)
+        else:
+            result[rows, columns] = (amplitudes * amplitudes) @ weights
+
+    tiles = tile_slices(x, y, tile)
+    workers = min(workers or os.cpu_count(), max(len(tiles), 1))
+    if workers == 1:
+        for tile_slice in tiles:
+            evaluate(tile_slice)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(evaluate, tiles))
+    return result
+
+def save_image(image, x, y, file_name, cmap = "afmhot", title = None):
+    '''
+    Saves the image (rows - y, columns - x) as a figure with the extent of the grid in Angstrom
+    '''
+    plt = rendering.pyplot()
+    fig, ax = plt.subplots(figsize=(6, 6 * (y[-1] - y[0]) / max(x[-1] - x[0], 1e-12)), dpi=200)
+    ax.imshow(image, origin="lower", extent=(x[0], x[-1], y[0], y[-1]), cmap=cmap)
+    ax.set_aspect("equal")
+    ax.axis("off")
+    if title is not None:
+        ax.set_title(title)
+    rendering.finish(fig, file_name, block=False)
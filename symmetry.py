@@ -0,0 +1,196 @@
+import numpy as np
+import scipy as scp
+from instrumentation import stage
+
+'''
+In-plane symmetry of planar molecules (x, y plane, normal z) and symmetry-blocked diagonalisation of the Huckel Hamiltonian
+Operations are C2 (rotation by 180 degrees around the normal) and mirror planes perpendicular to the molecule, together with
+the plane of the molecule they form the groups Cs, C2h, C2v and D2h - only these abelian groups are used
+(benzene, coronene D6h -> D2h subgroup), so every irreducible representation is one block of the Hamiltonian
+Labels are the Mulliken symbols of the pi (p_z) orbitals - D2h: x axis along the longer mirror line of the molecule
+'''
+
+operation_names = {"Cs": (), "C2h": ("C2",), "C2v": ("sigma_v",), "D2h": ("C2", "sigma_xz", "sigma_yz")}
+characters = {"Cs": {"a''": ()},
+              "C2h": {"au": (1,), "bg": (-1,)},
+              "C2v": {"b1": (1,), "a2": (-1,)},
+              "D2h": {"au": (1, -1, -1), "b1u": (1, 1, 1), "b2g": (-1, 1, -1), "b3g": (-1, -1, 1)}}
+
+
+class Point_group:
+    '''
+    Point group of a planar molecule - its operations are stored as permutations of the atoms
+    (operation maps atom i onto atom permutation[i], every operation is its own inverse)
+    '''
+    def __init__(self, name, operations, axis = None):
+        '''
+        :param name: "Cs", "C2h", "C2v" or "D2h"
+        :param operations: dictionary {operation name (see 'operation_names'): permutation of the atoms}
+        :param axis: unit vector of the x axis of the group (mirror line), None for Cs and C2h
+        '''
+        self.name = name
+        self.operations = operations
+        self.axis = axis
+        self.characters = characters[name]
+
+    def __repr__(self):
+        return f"Point_group({self.name})"
+
+    def commuting(self, hamiltonian, tolerance = 1e-10):
+        '''
+        Operations of the geometry are symmetries of the Hamiltonian only if all bonds are mapped onto bonds with the same
+        hopping (e.g. extended Huckel with slightly distorted bonds) - the others are removed
+        :return: Point_group of the operations commuting with the sparse Hamiltonian
+        '''
+        hamiltonian = scp.sparse.csr_matrix(hamiltonian)
+        scale = max(abs(hamiltonian).max() if hamiltonian.nnz else 0.0, 1.0)
+        kept = {name: permutation for name, permutation in self.operations.items()
+                if abs(hamiltonian[permutation][:, permutation] - hamiltonian).max() <= tolerance * scale}
+        if len(kept) == len(self.operations):
+            return self
+        if "C2" in kept:
+            return Point_group("C2h", {"C2": kept["C2"]})
+        mirrors = [name for name in ("sigma_xz", "sigma_yz", "sigma_v") if name in kept]
+        if mirrors:
+            axis = self.axis if mirrors[0] != "sigma_yz" else np.array([-self.axis[1], self.axis[0]])
+            return Point_group("C2v", {"sigma_v": kept[mirrors[0]]}, axis)
+        return Point_group("Cs", {})
+
+    def symmetry_adapted_basis(self):
+        '''
+        Projections of the atomic orbitals onto the irreducible representations - one basis vector for every orbit
+        of atoms with a non-zero projection
+        :return: dictionary {irrep label: sparse (N, n_irrep) matrix with orthonormal columns}
+        '''
+        permutations = [None] + [self.operations[name] for name in operation_names[self.name]]
+        dimension = len(permutations[1]) if len(permutations) > 1 else None
+        basis = {}
+        for label, chars in self.characters.items():
+            if dimension is None:
+                basis[label] = None
+                continue
+            orbit = np.stack([np.arange(dimension)] + permutations[1:])
+            representatives = np.flatnonzero(orbit.min(axis=0) == np.arange(dimension))
+            rows = orbit[:, representatives].ravel()
+            columns = np.tile(np.arange(len(representatives)), len(permutations))
+            values = np.repeat(np.array((1,) + chars, dtype=float), len(representatives))
+            vectors = scp.sparse.csc_matrix((values, (rows, columns)), shape=(dimension, len(representatives)))
+            norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=0)).ravel())
+            nonzero = norms > 1e-12
+            basis[label] = vectors[:, nonzero] @ scp.sparse.diags(1 / norms[nonzero])
+        return basis
+
+    def irrep_weights(self, eigenvectors):
+        '''
+        :return: (irreps, states) array - weight of every irreducible representation in every state (sum 1 per state)
+        '''
+        overlaps = [np.sum(eigenvectors * eigenvectors, axis=0)]
+        overlaps += [np.sum(eigenvectors * eigenvectors[self.operations[name]], axis=0) for name in operation_names[self.name]]
+        overlaps = np.array(overlaps)
+        group_order = len(overlaps)
+        return np.array([np.array((1,) + chars) @ overlaps / group_order for chars in self.characters.values()])
+
+    def labels(self, eigenvectors, threshold = 0.99):
+        '''
+        :return: list of irrep labels of the states (columns), "?" for a state mixing several irreps (degenerate states
+                 of a solver not respecting the symmetry)
+        '''
+        names = list(self.characters)
+        weights = self.irrep_weights(np.asarray(eigenvectors))
+        best = np.argmax(weights, axis=0)
+        return [names[k] if weights[k, state] >= threshold else "?" for state, k in enumerate(best)]
+
+
+def find_permutation(transformed, coordinates, elements, tolerance, tree):
+    '''
+    :return: permutation mapping every atom onto the atom of the same element at its transformed position, None if the
+             transformed molecule does not coincide with the molecule (within the tolerance)
+    '''
+    distance, index = tree.query(transformed, distance_upper_bound=tolerance)
+    if np.any(np.isinf(distance)) or len(np.unique(index)) != len(index) or np.any(elements[index] != elements):
+        return None
+    return index
+
+def mirror(coordinates, direction):
+    '''
+    :return: coordinates reflected by the mirror line through the origin with the unit direction
+    '''
+    return 2 * np.outer(coordinates @ direction, direction) - coordinates
+
+def candidate_directions(coordinates):
+    '''
+    Possible mirror lines through the centroid - principal axes of the molecule; for molecules with a higher symmetry
+    (isotropic principal axes - benzene, coronene) directions to the atoms closest to the centroid
+    :return: array of unit vectors
+    '''
+    covariance = coordinates.T @ coordinates / max(len(coordinates), 1)
+    spread, axes = np.linalg.eigh(covariance)
+    directions = [axes[:, 1], axes[:, 0]]
+    if spread[1] - spread[0] <= 1e-3 * max(spread[1], 1e-12):
+        radius = np.sqrt(np.sum(coordinates**2, axis=1))
+        shell = np.flatnonzero(np.abs(radius - np.min(radius[radius > 1e-6], initial=np.inf)) < 1e-3)[:12]
+        for atom in shell:
+            direction = coordinates[atom] / radius[atom]
+            directions += [direction, np.array([-direction[1], direction[0]])]
+    return np.array(directions)
+
+@stage
+def detect_point_group(coordinates, elements = None, tolerance = 0.01):
+    '''
+    Finds the in-plane symmetry operations of the molecule (about its centroid) within the tolerance
+    :param coordinates: (N,2) coordinates (x, y) of the atoms
+    :param elements: element codes - atoms are mapped only onto atoms of the same element (None -> all atoms equal)
+    :param tolerance: maximal distance [Angstrom] between an atom and the image of its partner
+    :return: Point_group (Cs, C2h, C2v or D2h)
+    '''
+    coordinates = np.asarray(coordinates, dtype=float)[:, :2]
+    if len(coordinates) == 0:
+        return Point_group("Cs", {})
+    elements = np.zeros(len(coordinates), dtype=np.int8) if elements is None else np.asarray(elements)
+    centered = coordinates - coordinates.mean(axis=0)
+    from scipy.spatial import cKDTree
+    tree = cKDTree(centered)
+    rotation = find_permutation(-centered, centered, elements, tolerance, tree)
+    mirrors = []
+    for direction in candidate_directions(centered):
+        permutation = find_permutation(mirror(centered, direction), centered, elements, tolerance, tree)
+        if permutation is not None:
+            mirrors.append((direction, permutation))
+    for first, (direction, permutation) in enumerate(mirrors):
+        for other, other_permutation in mirrors[first + 1:]:
+            if abs(direction @ other) < 1e-6 and rotation is not None:
+                '''
+                x axis - mirror line along the longer extent of the molecule
+                '''
+                if np.ptp(centered @ other) > np.ptp(centered @ direction) + tolerance:
+                    direction, permutation, other_permutation = other, other_permutation, permutation
+                return Point_group("D2h", {"C2": rotation, "sigma_xz": permutation, "sigma_yz": other_permutation}, direction)
+    if mirrors:
+        return Point_group("C2v", {"sigma_v": mirrors[0][1]}, mirrors[0][0])
+    if rotation is not None:
+        return Point_group("C2h", {"C2": rotation})
+    return Point_group("Cs", {})
+
+@stage
+def symmetry_eigh(hamiltonian, group):
+    '''
+    Diagonalises the Hamiltonian block by block - one dense block for every irreducible representation
+    (D2h - four blocks of about N/4 states, about 16x faster than the whole matrix)
+    :param group: Point_group of the molecule (operations not commuting with the Hamiltonian are ignored)
+    :return: tuple (eigenvalues sorted by energy, eigenvectors in the original atom order, irrep labels of the states)
+    '''
+    hamiltonian = scp.sparse.csr_matrix(hamiltonian)
+    group = group.commuting(hamiltonian)
+    eigenvalues, eigenvectors, labels = [], [], []
+    for label, basis in group.symmetry_adapted_basis().items():
+        if basis is None:
+            values, vectors = scp.linalg.eigh(hamiltonian.toarray())
+        else:
+            values, block_vectors = scp.linalg.eigh((basis.T @ hamiltonian @ basis).toarray())
+            vectors = basis @ block_vectors
+        eigenvalues.append(values)
+        eigenvectors.append(vectors)
+        labels += [label] * len(values)
+    eigenvalues = np.concatenate(eigenvalues)
+    order = np.argsort(eigenvalues, kind="stable")
+    return eigenvalues[order], np.hstack(eigenvectors)[:, order], [labels[k] for k in order]
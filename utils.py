@@ -1,6 +1,7 @@
+import itertools
 import re
-import sys
 import numpy as np
+from instrumentation import stage
 
 
 periodic_table = [
@@ -21,43 +22,136 @@ periodic_table = [
 def modify_rows(string):
     return re.split(r'\s+', string)
 
+element_codes = {element: code for code, element in enumerate(periodic_table)}
+
+def symbols_to_codes(symbols):
+    '''
+    Converts element symbols to element codes - index of the element in 'periodic_table'
+    Every distinct symbol is looked up only once; labels such as "C1" or "c" are accepted
+    :param symbols: array of element symbols
+    :return: np.int8 array of element codes
+    '''
+    unique_symbols, inverse = np.unique(np.asarray(symbols), return_inverse=True)
+    unique_codes = np.empty(len(unique_symbols), dtype=np.int8)
+    for k, symbol in enumerate(unique_symbols):
+        element = re.sub(r'[^A-Za-z]', '', str(symbol)).capitalize()
+        if element not in element_codes:
+            raise ValueError(f"Unknown element '{symbol}'")
+        unique_codes[k] = element_codes[element]
+    return unique_codes[inverse.reshape(-1)]
+
+def tokenise_atom_lines(lines, symbol_column, first_line = None):
+    '''
+    Tokenises a block of atom lines at once (one split of the whole block instead of a split of every row)
+    :param lines: list of lines, each describing one atom
+    :param symbol_column: column containing the element symbol (0 for ".xyz", -1 for ".in")
+    :param first_line: line number of the first atom line in the file (error messages), None -> atoms are counted
+    :return: tuple (element codes - np.int8 array, coordinates - (N,3) np.float64 array)
+    '''
+    if not lines:
+        return np.zeros(0, dtype=np.int8), np.zeros((0, 3))
+    rows = [line.split() for line in lines]
+    counts = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+    minimum = 4 if symbol_column == 0 else 5
+    short = np.flatnonzero(counts < minimum)
+    if len(short):
+        where = f"Atom {short[0] + 1}" if first_line is None else f"Line {first_line + short[0]}"
+        raise ValueError(f"{where}: atom line needs an element symbol and x, y, z coordinates "
+                         f"- '{lines[short[0]].strip()}'")
+    if np.all(counts == counts[0]):
+        table = np.array(rows)
+    else:
+        # rows with a different number of columns - only the symbol and x, y, z columns are kept
+        table = np.array([row[:4] if symbol_column == 0 else row[:4] + row[-1:] for row in rows])
+    coordinates = table[:, 1:4].astype(np.float64)
+    return symbols_to_codes(table[:, symbol_column]), coordinates
+
+def read_xyz(file):
+    '''
+    Fast reader of the ".xyz" format - the first line gives the number of atoms, the second line is a comment
+    Only the first frame of a multi-frame file is read (all frames - see 'read_xyz_frames')
+    Files without the header are also accepted - every line starting with an element symbol is an atom
+    :param file: file in ".xyz" format
+    :return: tuple (element codes - np.int8 array, coordinates - (N,3) np.float64 array)
+    '''
+    with open(file, "r") as f:
+        first_line = f.readline()
+        header = first_line.split()
+        if len(header) == 1 and header[0].isdigit():
+            '''
+            Only the lines of the first frame are read - the rest of a trajectory stays on the disk
+            '''
+            atom_count = int(header[0])
+            f.readline()
+            atom_lines = list(itertools.islice(f, atom_count))
+            if len(atom_lines) != atom_count:
+                raise ValueError(f"File '{file}' contains less atoms than declared in the header")
+            return tokenise_atom_lines(atom_lines, 0, first_line=3)
+        else:
+            atom_lines = [line for line in itertools.chain((first_line,), f)
+                          if line.split() and re.sub(r'[^A-Za-z]', '', line.split()[0]).capitalize() in element_codes]
+    return tokenise_atom_lines(atom_lines, 0)
+
+def read_xyz_frames(file):
+    '''
+    Generator reading a multi-frame ".xyz" file (MD or relaxation trajectory) frame by frame -
+    only one frame is held in memory at a time
+    :param file: file in ".xyz" format with one or more frames
+    :return: yields tuples (element codes - np.int8 array, coordinates - (N,3) np.float64 array) for every frame
+    '''
+    line = 0
+    with open(file, "r") as f:
+        for header in f:
+            line += 1
+            if not header.strip():
+                continue
+            atom_count = int(header.split()[0])
+            f.readline()
+            atom_lines = list(itertools.islice(f, atom_count))
+            if len(atom_lines) != atom_count:
+                raise ValueError(f"Last frame of the file '{file}' is incomplete")
+            yield tokenise_atom_lines(atom_lines, 0, first_line=line + 2)
+            line += 1 + atom_count
+
+def read_geometry_in(file):
+    '''
+    Fast reader of the ".in" format (FHI Aims) - lines "atom x y z element"
+    :param file: file in ".in" format
+    :return: tuple (element codes - np.int8 array, coordinates - (N,3) np.float64 array)
+    '''
+    with open(file, "r") as f:
+        atom_lines = [line for line in f if line.split()[:1] == ["atom"]]
+    return tokenise_atom_lines(atom_lines, -1)
+
+@stage
+def read_geometry(file):
+    '''
+    Reads the geometry from ".xyz" or ".in" (FHI Aims) format - chosen according to the file extension
+    :return: tuple (element codes - np.int8 array, coordinates - (N,3) np.float64 array)
+    '''
+    if file.endswith(".in"):
+        return read_geometry_in(file)
+    return read_xyz(file)
+
+def write_xyz(file, elements, coordinates):
+    '''
+    Writes the geometry into a file in ".xyz" format
+    :param elements: element codes (index in 'periodic_table')
+    :param coordinates: (N,3) array of x, y, z coordinates
+    '''
+    with open(file, "w") as f:
+        f.write(f"{len(elements)}\n\n")
+        f.writelines(f"{periodic_table[code]}    {x}    {y}    {z}    \n" for code, (x, y, z) in zip(elements, coordinates.tolist()))
+
 def in_file_to_xyz(file):
     '''
     Convert geometry from ".in" format (FHI Aims) to ".xyz" format
     :param file: file in ".in" format
     :return: coordinates in ".xyz" format - the name remains the same as the original file with a change in extension
+    Raises FileNotFoundError if the file does not exist
     '''
-    coordinates_list = []
-    try:
-        with open(file, "r") as f:
-            lines = f.readlines()
-        for line in lines:
-            if "atom" in line:
-                # Split the line based on any whitespace
-                values = re.split(r'\s+', line.strip())
-                coordinates_list.append(values)
-        coordinates_list_xyz = [[sublist[-1], float(sublist[1]), float(sublist[2]), float(sublist[3])] for sublist in coordinates_list]
-        try:
-            f = open(f"{file.split('.')[0]}.xyz", "w")
-            f.write(f"{len(coordinates_list_xyz)}\n")
-            f.write("\n")
-            for a in range(len(coordinates_list_xyz)):
-                for i in range(4):
-                    f.write(f"{coordinates_list_xyz[a][i]}    ")
-                f.write("\n")
-            f.close()
-        except:
-            f = open(f"{file.split('.')[0]}.xyz", "a")
-            f.write(f"{len(coordinates_list_xyz)}\n")
-            f.write("\n")
-            for a in range(len(coordinates_list_xyz)):
-                for i in range(4):
-                    f.write(f"{coordinates_list_xyz[a][i]}    ")
-                f.write("\n")
-            f.close()
-    except FileNotFoundError:
-        print("FileNotFoundError")
-        sys.exit()
+    elements, coordinates = read_geometry_in(file)
+    write_xyz(f"{file.split('.')[0]}.xyz", elements, coordinates)
 
 def calculate_lengt(min_value, max_value):
     '''
@@ -70,62 +164,31 @@ def calculate_lengt(min_value, max_value):
     else:
         return int(abs(round(min_value - max_value, 0)))
 
+@stage
 def load_coordinates(file, carbon_only):
     '''
-    Funkce přečte soubor ve formátu ".xyz" na 2d np.array - pouze pro planární molekuly -
+    Funkce přečte soubor ve formátu ".xyz" (nebo ".in") na 2d np.array - pouze pro planární molekuly -
     mající nenulové hodnoty pouze v souřadnicích x,y
     Vrátí FileNotFoundError - není-li funkce definována
     Je-li definována "špatně" - nejedná se o planární molekulu - výpočet proběhne se zanedbáním molekuly 'z'
-                              - nekontroluje, zda se nejedná o jiný typ formátu
     :param soubor: soubor ve formátu ".xyz"
+    :param carbon_only: True -> vrátí pouze atomy uhlíku
     :return: 2d numpy array obsahující x,y souřadnice molekuly
     '''
-    coordinates_list = []
-    i = 0
-    try:
-        with open(file, "r") as f:
-            for line in f:
-                if not carbon_only:
-                    for element in periodic_table:
-                        if element in line:
-                            coordinates_list.append(modify_rows(line.strip()))
-                else:
-                    if "C" in line:
-                        coordinates_list.append(modify_rows(line.strip()))
-                i += 1
-        cleaned_list_of_lists = [[item.strip() for item in sublist if item.strip() != ''] for sublist in coordinates_list]
-        coordinates_list = [sublist for sublist in cleaned_list_of_lists if sublist]
-    except FileNotFoundError:
-        print("FileNotFoundError")
-        sys.exit()
-    coordinates = np.array([float(coordinates_list[i][j+1]) for i in range(len(coordinates_list)) for j in range(2)]).reshape(len(coordinates_list),2)
-    return coordinates
+    return load_coordinates_3d(file, carbon_only)[:, :2]
 
+@stage
 def load_coordinates_3d(file, carbon_only):
     '''
-        Function reads a file in ".xyz" format into a 3d np.array - returning the x, y, z coordinates
+        Function reads a file in ".xyz" (or ".in") format into a 3d np.array - returning the x, y, z coordinates
         Raises FileNotFoundError if the function is not defined
         :param file: file in ".xyz" format
+        :param carbon_only: True -> only carbon atoms are returned
         :return: 3d numpy array containing x, y, z coordinates of the molecule
         '''
-    coordinates_list = []
-    try:
-        with open(file, "r") as f:
-            for line in f:
-                if not carbon_only:
-                    for element in periodic_table:
-                        if element in line:
-                            coordinates_list.append(modify_rows(line.strip()))
-                else:
-                    if "C" in line:
-                        coordinates_list.append(modify_rows(line.strip()))
-        cleaned_list_of_lists = [[item.strip() for item in sublist if item.strip() != ''] for sublist in coordinates_list]
-        # Remove sublists that became empty after removing ' '
-        coordinates_list = [sublist for sublist in cleaned_list_of_lists if sublist]
-    except FileNotFoundError:
-        print("FileNotFoundError")
-        sys.exit()
-    coordinates = np.array([float(coordinates_list[i][j+1]) for i in range(len(coordinates_list)) for j in range(3)]).reshape(len(coordinates_list),3)
+    elements, coordinates = read_geometry(file)
+    if carbon_only:
+        return coordinates[elements == element_codes["C"]]
     return coordinates
 
 def check_input_validity(parameter_value, parameter, variable_type):
@@ -139,6 +202,7 @@ def check_input_validity(parameter_value, parameter, variable_type):
     if not isinstance(parameter_value, variable_type):
         raise ValueError(f"Parameter '{parameter}' must be of type '{variable_type}'")
 
+@stage
 def distance_matrix(coordinates_matrix):
     '''
     Function returns a matrix that determines the distance (in Cartesian coordinates) between atom i,j
@@ -150,6 +214,7 @@ def distance_matrix(coordinates_matrix):
     distance = np.sqrt(x**2 + y**2)
     return distance
 
+@stage
 def distance_matrix_3d(coordinates_matrix):
     '''
         Function returns a matrix that determines the distance (in Cartesian coordinates) between atom i,j
@@ -162,3 +227,34 @@ def distance_matrix_3d(coordinates_matrix):
     distance = np.sqrt(x**2 + y**2 + z**2)
     return distance
 
+
+@stage
+def neighbour_list(coordinates_matrix, cutoff):
+    '''
+    Function returns all pairs of atoms i < j closer than the cutoff distance (KD-tree search) - memory grows only
+    with the number of pairs, not with the square of the number of atoms as for 'distance_matrix'
+    :param coordinates_matrix: matrix containing x, y (or x, y, z) coordinates of the molecule
+    :param cutoff: maximal distance between atoms of the pair
+    :return: tuple of arrays (i, j, distance) sorted by i, j
+    '''
+    atom_count = len(coordinates_matrix)
+    if atom_count <= 2000:
+        '''
+        Small molecule - all distances are computed directly in blocks of rows (faster start - scipy.spatial is not imported)
+        '''
+        i, j = [np.zeros(0, dtype=np.intp)], [np.zeros(0, dtype=np.intp)]
+        for start in range(0, atom_count, 256):
+            block = coordinates_matrix[start:start + 256]
+            squares = np.sum((block[:, None, :] - coordinates_matrix[None, :, :])**2, axis=2)
+            upper = np.arange(atom_count)[None, :] > np.arange(start, start + len(block))[:, None]
+            rows, columns = np.nonzero((squares <= cutoff**2) & upper)
+            i.append(rows + start)
+            j.append(columns)
+        i, j = np.concatenate(i), np.concatenate(j)
+    else:
+        from scipy.spatial import cKDTree
+        pairs = cKDTree(coordinates_matrix).query_pairs(r=cutoff, output_type="ndarray")
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))] if len(pairs) else pairs.reshape(0, 2)
+        i, j = pairs[:, 0], pairs[:, 1]
+    distance = np.sqrt(np.sum((coordinates_matrix[i] - coordinates_matrix[j])**2, axis=1))
+    return i, j, distance